@@ -1,40 +1,249 @@
+from typing import Optional
+
 from django.contrib import admin
+from django.contrib.admin.utils import get_fields_from_path
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections, router
+from django.db.models import Q, QuerySet
+from django.forms.models import BaseInlineFormSet
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from .models import (
+    ArchivedHistoryItem,
+    Execution,
+    HistoryItem,
+    Meta,
+    Process,
+    Step,
+    StepContent,
+)
+
+
+def estimated_count(model) -> Optional[int]:
+    """Number of rows in the table of the model according to the statistics of the database"""
+    connection = connections[router.db_for_read(model)]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [connection.ops.quote_name(model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    # tables that were never analyzed have no estimate
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that doesn't count every row. Unfiltered tables are counted from
+    the statistics of the database where available, anything else is counted
+    up to COUNT_LIMIT rows, so pages beyond that are not linked.
+    """
+
+    COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model)
+            if estimate is not None and estimate > self.COUNT_LIMIT:
+                return estimate
+        return queryset[: self.COUNT_LIMIT].count()
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    Changelists that load in bounded time regardless of the size of the table.
+    Search only matches exact values, so that it is served by an index:
+    list indexed fields in search_fields, e.g. primary and foreign keys.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_help_text = "Exact ID"
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+
+        query = Q()
+        for path in self.search_fields:
+            field = get_fields_from_path(self.model, path)[-1]
+            try:
+                query |= Q(**{path: field.to_python(term)})
+            except ValidationError:
+                # e.g. not a UUID, can't match that field
+                continue
+        return (queryset.filter(query) if query else queryset.none()), False
+
+
+class CappedInlineFormSet(BaseInlineFormSet):
+    cap = None
+
+    def get_queryset(self):
+        if not hasattr(self, "_queryset"):
+            self._queryset = super().get_queryset()[: self.cap]
+        return self._queryset
+
+
+class CappedInline(admin.TabularInline):
+    """
+    Inline showing only the first `cap` related objects in its ordering.
+    The parent admin links to the changelist of all of them, see changelist_link.
+    """
+
+    formset = CappedInlineFormSet
+    cap = 20
 
-from .models import Execution, HistoryItem, Meta, Process, Step
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.cap = self.cap
+        return formset
 
-admin.site.register(Step)
+
+def changelist_link(model, lookup: str, obj, label: str) -> str:
+    if obj._state.adding:
+        return "-"
+    url = reverse(f"admin:backend_{model._meta.model_name}_changelist")
+    return format_html('<a href="{}?{}={}">{}</a>', url, lookup, obj.pk, label)
 
 
 class StepInline(admin.TabularInline):
     model = Step
+    # contents are shared and immutable, steps pick one by id
+    raw_id_fields = ("content",)
     extra = 1
 
 
-class ProcessInline(admin.TabularInline):
+class ProcessInline(CappedInline):
     model = Process
     readonly_fields = ("createdAt",)
     ordering = ("-createdAt",)
     extra = 1
 
 
-class HistoryItemInline(admin.TabularInline):
+class HistoryItemInline(CappedInline):
     model = HistoryItem
     readonly_fields = ("at",)
-    ordering = ("-at",)
+    raw_id_fields = ("step", "by")
+    # ids follow the order of the items, and are indexed per execution
+    ordering = ("-id",)
     extra = 1
 
 
+class ArchivedHistoryItemInline(CappedInline):
+    model = ArchivedHistoryItem
+    fields = ("id", "type", "step", "at", "by")
+    readonly_fields = fields
+    ordering = ("-id",)
+    extra = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("step", "by")
+
+    def has_add_permission(self, request, obj):
+        return False
+
+
+@admin.register(Step)
+class StepAdmin(ScalableAdmin):
+    list_display = ("id", "process", "position", "content")
+    list_select_related = ("process", "content")
+    raw_id_fields = ("process", "content")
+    search_fields = ("process__revision",)
+    search_help_text = "Exact revision"
+
+
+@admin.register(StepContent)
+class StepContentAdmin(ScalableAdmin):
+    list_display = ("id", "title", "type")
+    search_fields = ("id", "hash")
+    search_help_text = "Exact ID or hash"
+
+    # contents are shared by revisions and found by their hash, see StepContent.intern
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Process)
-class ProcessAdmin(admin.ModelAdmin):
+class ProcessAdmin(ScalableAdmin):
     inlines = [StepInline]
+    list_display = ("revision", "title", "meta", "createdAt")
+    list_select_related = ("meta",)
+    raw_id_fields = ("meta",)
+    search_fields = ("revision", "meta__id")
+    search_help_text = "Exact revision or process ID"
 
 
 @admin.register(Meta)
-class MetaAdmin(admin.ModelAdmin):
+class MetaAdmin(ScalableAdmin):
     inlines = [ProcessInline]
-    readonly_fields = ("id",)
+    list_display = ("id", "current_revision", "createdBy", "createdAt")
+    list_select_related = ("current_revision", "createdBy")
+    raw_id_fields = ("createdBy",)
+    readonly_fields = ("id", "current_revision", "all_revisions")
+    search_fields = ("id", "current_revision__revision")
+    search_help_text = "Exact process ID or revision"
+
+    @admin.display(description="Revisions")
+    def all_revisions(self, obj):
+        return changelist_link(Process, "meta__id__exact", obj, "Show all")
 
 
 @admin.register(Execution)
-class ExecutionAdmin(admin.ModelAdmin):
-    inlines = [HistoryItemInline]
+class ExecutionAdmin(ScalableAdmin):
+    inlines = [HistoryItemInline, ArchivedHistoryItemInline]
+    list_display = ("id", "process", "initiatedBy", "initiatedAt", "state")
+    list_select_related = ("process", "initiatedBy")
+    list_filter = ("state",)
+    raw_id_fields = ("initiatedBy", "process")
+    readonly_fields = ("state", "all_history")
+    search_fields = ("id", "meta__id", "initiatedBy__username")
+    search_help_text = "Exact execution ID, process ID or username"
+
+    @admin.display(description="History")
+    def all_history(self, obj):
+        return changelist_link(HistoryItem, "execution__id__exact", obj, "Show all")
+
+    def get_inlines(self, request, obj):
+        # the history of an archived execution is read-only
+        if obj is not None and obj.archived:
+            return [ArchivedHistoryItemInline]
+        return super().get_inlines(request, obj)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # history items might have been edited through the inline
+        form.instance.rebuild_state()
+
+
+@admin.register(HistoryItem)
+class HistoryItemAdmin(ScalableAdmin):
+    list_display = ("id", "execution", "type", "step", "at", "by")
+    list_select_related = ("execution", "step", "by")
+    raw_id_fields = ("execution", "step", "by")
+    search_fields = ("execution__id",)
+    search_help_text = "Exact execution ID"
+
+    # edited through ExecutionAdmin, which keeps the state of the execution in sync
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
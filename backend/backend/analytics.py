@@ -0,0 +1,97 @@
+"""
+Statistics of the time steps take from being started to being done,
+read from the rollups maintained in StepDurationBucket.
+"""
+
+import math
+from collections import defaultdict
+
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Meta, Step, StepDurationBucket
+
+
+def _quantile(buckets: list[tuple[int, int, float]], total: int, q: float) -> float:
+    """
+    Upper bound of the bucket holding the q-quantile, by nearest rank.
+    Capped by the longest duration in that bucket, so it never exceeds the maximum.
+    """
+    rank = max(math.ceil(q * total), 1)
+    cumulative = 0
+    for bucket, count, max_seconds in buckets:
+        cumulative += count
+        if cumulative >= rank:
+            return min(StepDurationBucket.upper_bound(bucket), max_seconds)
+    raise ValueError("total exceeds the counts of the buckets")
+
+
+def _occurrence(step: str = ""):
+    """
+    Number of steps before the step at the given path in its revision with
+    the same title. Tells apart the steps of a revision which share a title.
+    """
+    return Coalesce(
+        Subquery(
+            Step.objects.filter(
+                process=OuterRef(f"{step}process"),
+                content__title=OuterRef(f"{step}content__title"),
+                content__type=Step.Type.Step,
+                position__lt=OuterRef(f"{step}position"),
+            )
+            .order_by()
+            .values("process")
+            .annotate(count=Count("*"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def step_durations(meta: Meta) -> list[dict]:
+    """
+    p50, p95 and maximum duration in seconds of each step of the current
+    revision of a process. Steps of earlier revisions count towards the step
+    with the same title, so reordering or inserting steps keeps their
+    statistics. Steps sharing a title are matched in their order, e.g. the
+    second "Check" of a revision with the second "Check" of the others.
+    A renamed step starts over.
+    """
+    rows = (
+        StepDurationBucket.objects.filter(
+            step__process__meta=meta, step__content__type=Step.Type.Step
+        )
+        .values("step__content__title", "bucket", occurrence=_occurrence("step__"))
+        .annotate(count=Sum("count"), max_seconds=Max("max_seconds"))
+        .order_by("bucket")
+    )
+    buckets = defaultdict(list)
+    for row in rows:
+        buckets[row["step__content__title"], row["occurrence"]].append(
+            (row["bucket"], row["count"], row["max_seconds"])
+        )
+
+    result = []
+    occurrences = defaultdict(int)
+    steps = (
+        Step.objects.filter(
+            process=meta.current_revision_id, content__type=Step.Type.Step
+        )
+        .values("position", title=F("content__title"))
+        .order_by("position")
+    )
+    for step in steps:
+        of_step = buckets.get((step["title"], occurrences[step["title"]]), [])
+        occurrences[step["title"]] += 1
+        total = sum(count for _, count, _ in of_step)
+        result.append(
+            {
+                "step_idx": step["position"],
+                "title": step["title"],
+                "count": total,
+                "p50": _quantile(of_step, total, 0.5) if total else None,
+                "p95": _quantile(of_step, total, 0.95) if total else None,
+                "max": max(m for _, _, m in of_step) if total else None,
+            }
+        )
+    return result
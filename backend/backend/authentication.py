@@ -0,0 +1,146 @@
+"""
+Authentication classes caching the resolved users and verified credentials.
+
+A user is cached together with the generation of its cache entries, which is
+replaced whenever the user is saved or deleted. Changing the password or the
+active flag through the ORM thus takes effect with the next request, other
+changes (e.g. queryset.update()) once the entries expire, see CACHES["auth"].
+"""
+
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.crypto import salted_hmac
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.authentication import BasicScheme
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework import authentication, exceptions
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from . import routers
+
+
+def auth_cache():
+    return caches["auth"]
+
+
+def _generation_key(user_id) -> str:
+    return f"user-generation:{user_id}"
+
+
+def _user_key(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def cached_user(user_id):
+    """User with the given primary key, or None. Read from the cache where possible."""
+    cache = auth_cache()
+    generation_key, user_key = _generation_key(user_id), _user_key(user_id)
+    entries = cache.get_many([generation_key, user_key])
+
+    generation = entries.get(generation_key)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        if not cache.add(generation_key, generation, timeout=None):
+            generation = cache.get(generation_key)
+
+    if user_key in entries and entries[user_key][0] == generation:
+        return entries[user_key][1]
+
+    # the generation is read before the user, so a concurrent change is not missed
+    user = get_user_model()._default_manager.filter(pk=user_id).first()
+    cache.set(user_key, (generation, user))
+    return user
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL, dispatch_uid="auth_user_saved")
+@receiver(
+    post_delete, sender=settings.AUTH_USER_MODEL, dispatch_uid="auth_user_deleted"
+)
+def invalidate_user(sender, instance, **kwargs):
+    cache = auth_cache()
+    cache.set(_generation_key(instance.pk), uuid.uuid4().hex, timeout=None)
+    cache.delete(_user_key(instance.pk))
+
+
+class CachedBasicAuthentication(authentication.BasicAuthentication):
+    """
+    Basic authentication remembering verified credentials, so the password
+    hash only has to be computed on the first request.
+    """
+
+    def authenticate_credentials(self, userid, password, request=None):
+        cache = auth_cache()
+        key = "basic:" + salted_hmac(__name__, f"{userid}\0{password}").hexdigest()
+
+        # the user's password hash at the time the credentials were verified
+        if (verified := cache.get(key)) is not None:
+            user_id, password_hash = verified
+            user = cached_user(user_id)
+            if user is not None and user.is_active and user.password == password_hash:
+                return (user, None)
+
+        user, auth = super().authenticate_credentials(userid, password, request)
+        cache.set(key, (user.pk, user.password))
+        return (user, auth)
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            routers.authenticated(result[0])
+        return result
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication reading the user from the cache.
+    Expects USER_ID_FIELD to be the primary key of the user model.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = cached_user(user_id)
+        if user is None:
+            raise exceptions.AuthenticationFailed(
+                _("User not found"), code="user_not_found"
+            )
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _("User is inactive"), code="user_inactive"
+            )
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise exceptions.AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            routers.authenticated(result[0])
+        return result
+
+
+class CachedBasicScheme(BasicScheme):
+    target_class = CachedBasicAuthentication
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    target_class = CachedJWTAuthentication
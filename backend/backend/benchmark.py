@@ -0,0 +1,414 @@
+"""
+Benchmarks of the API endpoints against seeded datasets.
+
+Each endpoint is requested through the test client, recording the number
+of queries, the wall time and the peak memory allocated while handling
+the request. Payloads are also built and rendered outside of a request,
+comparing the fast paths with the serializers and orjson with the JSON
+renderer of DRF. See the benchmark management command for running it.
+"""
+
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field, replace
+from typing import Callable, Optional
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import payloads
+from .middleware import CODINGS
+from .models import Execution, Meta, Process, Step, StepContent
+from .renderers import ORJSONRenderer
+from .serializers import (
+    ExecutionSerializer,
+    ExecutionShallowSerializer,
+    ExecutionStateSerializer,
+    ProcessSerializer,
+)
+
+
+@dataclass(frozen=True)
+class Dataset:
+    templates: int = 5
+    revisions: int = 2
+    steps: int = 20
+    executions: int = 10
+    # number of steps marked as started and done in each execution
+    history: int = 10
+
+
+@dataclass
+class Seeded:
+    dataset: Dataset
+    user: User
+    meta: Meta
+    process: Process
+    execution: Execution
+
+
+@dataclass
+class Measurement:
+    status: int
+    queries: int
+    bytes: int
+    wall_ms: list[float] = field(default_factory=list)
+    peak_kib: float = 0
+
+    @property
+    def wall_ms_median(self) -> float:
+        return statistics.median(self.wall_ms)
+
+    def as_dict(self):
+        return {
+            "status": self.status,
+            "queries": self.queries,
+            "bytes": self.bytes,
+            "wall_ms_median": round(self.wall_ms_median, 3),
+            "wall_ms_min": round(min(self.wall_ms), 3),
+            "peak_kib": round(self.peak_kib, 1),
+        }
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    name: str
+    method: str
+    url: Callable[[Seeded], str]
+    data: Optional[Callable[[Seeded], dict]] = None
+
+
+def process_payload(ds: Dataset, title: str = "Benchmark") -> dict:
+    steps = [{"title": "Section", "type": "SE", "description": ""}]
+    steps += [
+        {
+            "title": f"Step {i}",
+            "type": "ST",
+            # without trailing whitespace, which the API trims
+            "description": " ".join(["Lorem ipsum dolor sit amet."] * 20),
+            "startWithPrevious": True,
+        }
+        for i in range(ds.steps)
+    ]
+    return {"title": title, "steps": steps}
+
+
+def mark_steps_operations(ds: Dataset) -> list[dict]:
+    """
+    Start every step, then mark all but the last one as done. That leaves
+    the state of the execution as seeded, whatever the size of the dataset.
+    """
+    # the first step of the process is a section
+    steps = range(1, ds.steps + 1)
+    return [{"step_idx": i, "mark_as": "StepStarted"} for i in steps] + [
+        {"step_idx": i, "mark_as": "StepDone"} for i in steps[:-1]
+    ]
+
+
+ENDPOINTS = [
+    Endpoint("processes_list", "get", lambda s: "/api/processes/"),
+    Endpoint("processes_retrieve", "get", lambda s: f"/api/processes/{s.meta.pk}/"),
+    Endpoint(
+        "processes_executions",
+        "get",
+        lambda s: f"/api/processes/{s.meta.pk}/executions/",
+    ),
+    Endpoint(
+        "executions_retrieve", "get", lambda s: f"/api/executions/{s.execution.pk}/"
+    ),
+    Endpoint(
+        "executions_retrieve_state",
+        "get",
+        lambda s: f"/api/executions/{s.execution.pk}/?view=state",
+    ),
+    Endpoint(
+        "executions_history",
+        "get",
+        lambda s: f"/api/executions/{s.execution.pk}/history/",
+    ),
+    Endpoint(
+        "processes_create",
+        "post",
+        lambda s: "/api/processes/",
+        lambda s: process_payload(s.dataset),
+    ),
+    Endpoint(
+        "processes_update",
+        "put",
+        lambda s: f"/api/processes/{s.meta.pk}/",
+        lambda s: process_payload(s.dataset),
+    ),
+    Endpoint(
+        "processes_patch",
+        "patch",
+        lambda s: f"/api/processes/{s.meta.pk}/",
+        lambda s: {
+            "operations": [
+                {"op": "update", "step_idx": 1, "step": {"title": "Patched"}},
+            ]
+        },
+    ),
+    Endpoint(
+        "processes_start_execution",
+        "post",
+        lambda s: f"/api/processes/{s.meta.pk}/start_execution/",
+    ),
+    Endpoint(
+        "processes_start_executions",
+        "post",
+        lambda s: f"/api/processes/{s.meta.pk}/start_executions/",
+        lambda s: {"count": 20},
+    ),
+    Endpoint(
+        "executions_mark_step",
+        "post",
+        lambda s: f"/api/executions/{s.execution.pk}/mark_step/",
+        lambda s: {"step_idx": 1, "mark_as": "StepDone"},
+    ),
+    Endpoint(
+        "executions_mark_steps",
+        "post",
+        lambda s: f"/api/executions/{s.execution.pk}/mark_steps/",
+        lambda s: {"operations": mark_steps_operations(s.dataset)},
+    ),
+    Endpoint(
+        "processes_export",
+        "get",
+        lambda s: f"/api/processes/{s.meta.pk}/export/?output=ndjson",
+    ),
+    Endpoint(
+        "processes_step_durations",
+        "get",
+        lambda s: f"/api/processes/{s.meta.pk}/step_durations/",
+    ),
+]
+
+
+def seed(ds: Dataset) -> Seeded:
+    """Populate the database with the given dataset"""
+    user = User.objects.create_user(f"benchmark-{User.objects.count()}")
+    payload = process_payload(ds)
+    # every revision of every template has the same steps
+    contents = StepContent.intern(payload["steps"])
+
+    for t in range(ds.templates):
+        meta = Meta.objects.create(createdBy=user)
+        for r in range(ds.revisions):
+            process = Process.objects.create(meta=meta, title=f"Template {t}.{r}")
+            Step.objects.bulk_create(
+                Step(process=process, position=position, content_id=content_id)
+                for position, content_id in enumerate(contents)
+            )
+
+        steps = [s for s in process.steps.all() if s.type == "ST"]
+        for e in range(ds.executions):
+            execution = Execution.objects.create(process=process, initiatedBy=user)
+            for step in steps[: ds.history]:
+                execution.record("StepStarted", step, user)
+                execution.record("StepDone", step, user)
+
+    return Seeded(
+        dataset=ds, user=user, meta=meta, process=process, execution=execution
+    )
+
+
+async def _join(stream) -> bytes:
+    return b"".join([chunk async for chunk in stream])
+
+
+def read_body(response) -> bytes:
+    """The body of a response, reading streamed ones to the end"""
+    if not response.streaming:
+        return response.content
+    if response.is_async:
+        return async_to_sync(_join)(response.streaming_content)
+    return b"".join(response.streaming_content)
+
+
+def measure(
+    client: APIClient, seeded: Seeded, endpoint: Endpoint, repeat: int = 5
+) -> Measurement:
+    """
+    Request the endpoint repeatedly. The revision cache is cleared before each
+    request, so every request takes the cold path.
+    """
+    url = endpoint.url(seeded)
+    data = endpoint.data(seeded) if endpoint.data else None
+    request = getattr(client, endpoint.method)
+
+    result = None
+    for _ in range(repeat):
+        caches["revisions"].clear()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = request(url, data, format="json")
+            # streamed responses do their work while being read
+            body = read_body(response)
+            wall_ms = (time.perf_counter() - start) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        if result is None:
+            result = Measurement(
+                status=response.status_code,
+                queries=len(ctx.captured_queries),
+                bytes=len(body),
+            )
+        result.wall_ms.append(wall_ms)
+        result.peak_kib = max(result.peak_kib, peak / 1024)
+
+    return result
+
+
+@dataclass(frozen=True)
+class Serialization:
+    """A payload built by the serializer and by the fast path, see payloads"""
+
+    name: str
+    load: Callable[[Seeded], object]
+    serializer: Callable[[object], object]
+    fast: Callable[[object], object]
+
+
+SERIALIZATIONS = [
+    Serialization(
+        "process",
+        lambda s: Process.objects.select_related("meta").get(pk=s.process.pk),
+        lambda p: ProcessSerializer(p).data,
+        lambda p: payloads.process_payloads([p])[0],
+    ),
+    Serialization(
+        "execution",
+        lambda s: Execution.objects.select_related("process__meta").filter(
+            pk=s.execution.pk
+        ),
+        lambda qs: ExecutionSerializer(
+            qs.prefetch_related("process__steps").get()
+        ).data,
+        lambda qs: payloads.execution_payload(qs.get()),
+    ),
+    Serialization(
+        "execution_state",
+        lambda s: Execution.objects.filter(pk=s.execution.pk),
+        lambda qs: ExecutionStateSerializer(
+            qs.prefetch_related("process__steps").get()
+        ).data,
+        lambda qs: payloads.execution_state_payload(qs.get()),
+    ),
+    Serialization(
+        "executions_shallow",
+        lambda s: Execution.objects.filter(meta=s.meta),
+        lambda qs: ExecutionShallowSerializer(qs, many=True).data,
+        lambda qs: payloads.shallow_execution_payloads(
+            qs.values(*payloads.SHALLOW_EXECUTION_FIELDS)
+        ),
+    ),
+]
+
+
+def compare_serialization(
+    seeded: Seeded, serialization: Serialization, repeat: int = 5
+) -> dict:
+    """
+    Wall time of building a payload with the serializer and with the fast path.
+    Both include the queries they need, but not those loading the object itself.
+    """
+    obj = serialization.load(seeded)
+    result = {}
+    for path in ("serializer", "fast"):
+        build = getattr(serialization, path)
+        wall_ms = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            build(obj)
+            wall_ms.append((time.perf_counter() - start) * 1000)
+        result[f"{path}_ms_median"] = round(statistics.median(wall_ms), 3)
+    result["speedup"] = round(
+        result["serializer_ms_median"] / result["fast_ms_median"], 2
+    )
+    return result
+
+
+RENDERERS = {"drf": JSONRenderer(), "orjson": ORJSONRenderer()}
+
+# payloads rendered by each renderer, built by the fast paths
+RENDERINGS = {
+    "processes_list": lambda s: payloads.process_payloads(
+        Process.objects.select_related("meta").filter(
+            pk__in=Meta.objects.values("current_revision")
+        )
+    ),
+    "execution": lambda s: payloads.execution_payload(
+        Execution.objects.select_related("process__meta").get(pk=s.execution.pk)
+    ),
+    "executions_shallow": lambda s: payloads.shallow_execution_payloads(
+        Execution.objects.filter(meta=s.meta).values(*payloads.SHALLOW_EXECUTION_FIELDS)
+    ),
+}
+
+
+def compare_rendering(seeded: Seeded, load: Callable, repeat: int = 5) -> dict:
+    """
+    Wall time of encoding a payload with the JSON renderer of DRF and with
+    orjson, and the size of the body as sent with each content coding
+    the server supports, see CompressionMiddleware.
+    """
+    data = load(seeded)
+    result = {}
+    for name, renderer in RENDERERS.items():
+        wall_ms = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = renderer.render(data)
+            wall_ms.append((time.perf_counter() - start) * 1000)
+        result[f"{name}_ms_median"] = round(statistics.median(wall_ms), 3)
+    result["speedup"] = round(result["drf_ms_median"] / result["orjson_ms_median"], 2)
+
+    result["bytes"] = {"identity": len(body)}
+    for coding, (compress, _) in CODINGS.items():
+        result["bytes"][coding] = len(compress(body))
+    return result
+
+
+def run_dataset(ds: Dataset, repeat: int = 5, endpoints=ENDPOINTS) -> dict:
+    seeded = seed(ds)
+    client = APIClient()
+    client.force_authenticate(seeded.user)
+
+    return {
+        "dataset": asdict(ds),
+        "endpoints": {
+            e.name: measure(client, seeded, e, repeat).as_dict() for e in endpoints
+        },
+        "serializations": {
+            s.name: compare_serialization(seeded, s, repeat) for s in SERIALIZATIONS
+        },
+        "renderings": {
+            name: compare_rendering(seeded, load, repeat)
+            for name, load in RENDERINGS.items()
+        },
+    }
+
+
+def sweep(base: Dataset, parameter: str, values: list[int], repeat: int = 5) -> dict:
+    """
+    Run the benchmark for each value of a dataset parameter, and check
+    that the number of queries per endpoint does not grow with it.
+    Values are expected in ascending order.
+    """
+    runs = [run_dataset(replace(base, **{parameter: v}), repeat=repeat) for v in values]
+
+    scaling = {}
+    for name in runs[0]["endpoints"]:
+        queries = [run["endpoints"][name]["queries"] for run in runs]
+        # the shape of the data may shift the count a little, but not grow it
+        scaling[name] = {"queries": queries, "flat": max(queries) <= queries[0]}
+
+    return {"parameter": parameter, "values": values, "runs": runs, "scaling": scaling}
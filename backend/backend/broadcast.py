@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from collections import defaultdict
+from functools import cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import HistoryItem
+from .serializers import HistoryItemSerializer
+
+
+class Subscription:
+    """
+    Queue of messages for a single subscriber.
+    Bound to the event loop it was created in, but can be fed from any thread.
+    """
+
+    def __init__(self, broadcaster: "Broadcaster", channel: str, maxsize: int):
+        self.broadcaster = broadcaster
+        self.channel = channel
+        self.overflowed = False
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=maxsize)
+
+    def push(self, message: dict):
+        self._loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message: dict):
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # the subscriber can't keep up, it has to resync and reconnect
+            self.overflowed = True
+
+    async def get(self, timeout: float) -> dict | None:
+        """Next message, or None if there was none within timeout seconds"""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+
+class Broadcaster:
+    """Fan-out of messages to the subscribers of a channel"""
+
+    def subscribe(self, channel: str) -> Subscription:
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription: Subscription):
+        raise NotImplementedError
+
+    def publish(self, channel: str, message: dict):
+        raise NotImplementedError
+
+
+class InProcessBroadcaster(Broadcaster):
+    """
+    Delivers messages to subscribers within the same process only.
+    Deployments running several server processes need a broadcaster
+    backed by a shared message bus instead, see EXECUTION_BROADCASTER.
+    """
+
+    queue_size = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions: dict[str, set[Subscription]] = defaultdict(set)
+
+    def subscribe(self, channel: str) -> Subscription:
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.channel, None)
+
+    def publish(self, channel: str, message: dict):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.push(message)
+
+
+@cache
+def _load_broadcaster(path: str) -> Broadcaster:
+    return import_string(path)()
+
+
+def get_broadcaster() -> Broadcaster:
+    return _load_broadcaster(settings.EXECUTION_BROADCASTER)
+
+
+@receiver(post_save, sender=HistoryItem, dispatch_uid="broadcast_history_item")
+def broadcast_history_item(sender, instance: HistoryItem, created, **kwargs):
+    """Push every new history item to the subscribers of its execution, once committed"""
+    if not created:
+        return
+
+    message = HistoryItemSerializer(instance).data
+    channel = str(instance.execution_id)
+    transaction.on_commit(lambda: get_broadcaster().publish(channel, message))
@@ -0,0 +1,43 @@
+import hashlib
+from typing import Iterable, Optional
+
+from django.core.cache import caches
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+
+def revision_cache():
+    """
+    Cache of serialized process revisions, keyed by revision UUID.
+    Revisions are immutable, so entries only leave the cache through eviction,
+    see CACHES["revisions"] in the settings.
+    """
+    return caches["revisions"]
+
+
+def invalidate_revision(revision):
+    revision_cache().delete(str(revision))
+
+
+def combined_etag(parts: Iterable) -> str:
+    """Strong ETag derived from the given parts, e.g. the revisions on a page"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def not_modified(request: HttpRequest, etag: str) -> Optional[HttpResponse]:
+    """
+    Evaluate the conditional request headers against the given ETag.
+    Returns a 304 (or 412) response if the client's copy is current, None otherwise.
+    """
+    response = get_conditional_response(request, etag=quote_etag(etag))
+    return response if response is None else with_etag(response, etag)
+
+
+def with_etag(response: HttpResponse, etag: str) -> HttpResponse:
+    response["ETag"] = quote_etag(etag)
+    return response
@@ -0,0 +1,90 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .broadcast import get_broadcaster
+from .models import Execution
+from .serializers import HistoryItemSerializer
+
+# seconds between comments sent to keep idle connections (and proxies) alive
+KEEPALIVE_INTERVAL = 15
+
+
+def authenticate(request):
+    """Authenticate a plain django request with the authentication classes of the API"""
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    user = Request(request, authenticators=authenticators).user
+    if not user.is_authenticated:
+        raise NotAuthenticated()
+    return user
+
+
+def history_since(execution_id: str, since: int) -> list[dict]:
+    execution = Execution.objects.only("snapshot").get(pk=execution_id)
+    items = (
+        execution.history_items()
+        .filter(id__gt=since)
+        .select_related("step")
+        .order_by("id")
+    )
+    return HistoryItemSerializer(items, many=True).data
+
+
+def format_event(message: dict) -> str:
+    return f"id: {message['id']}\nevent: history\ndata: {json.dumps(message)}\n\n"
+
+
+async def history_events(channel: str, since: int | None = None):
+    subscription = get_broadcaster().subscribe(channel)
+    try:
+        yield "retry: 3000\n\n"
+
+        # replay what the client missed, after subscribing so nothing gets lost
+        sent = 0
+        if since is not None:
+            for message in await sync_to_async(history_since)(channel, since):
+                yield format_event(message)
+                sent = message["id"]
+
+        # on overflow, the stream ends and the client reconnects
+        while not subscription.overflowed:
+            message = await subscription.get(timeout=KEEPALIVE_INTERVAL)
+            if message is None:
+                yield ": keep-alive\n\n"
+            elif message["id"] > sent:
+                yield format_event(message)
+    finally:
+        subscription.close()
+
+
+async def execution_events(request, pk):
+    """
+    Server-Sent Events stream of the history items of an execution,
+    pushed as they get created by mark_step or start_execution.
+
+    Clients resuming a stream get the items they missed replayed first,
+    starting after the Last-Event-ID header or the since query parameter.
+
+    Streams are held open, so this must be served through the ASGI
+    application in prapp/asgi.py.
+    """
+    try:
+        await sync_to_async(authenticate)(request)
+    except APIException as e:
+        return JsonResponse({"detail": str(e.detail)}, status=e.status_code)
+
+    if not await Execution.objects.filter(pk=pk).aexists():
+        raise Http404()
+
+    since = request.headers.get("Last-Event-ID", request.GET.get("since"))
+    since = int(since) if since and since.isdigit() else None
+
+    return StreamingHttpResponse(
+        history_events(str(pk), since),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
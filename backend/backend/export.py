@@ -0,0 +1,149 @@
+"""
+Streaming export of the executions of a process, with the timings of their steps.
+
+Executions are read through a server-side cursor and their step states one
+chunk of executions at a time, so memory use does not depend on the number
+of executions. Only the steps of the revisions seen so far are kept around.
+
+The lines are produced by async generators, each chunk being read from the
+database in a worker thread, so that the ASGI server sends them as they
+come. A sync iterator would be read into a list before sending anything.
+"""
+
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+from typing import AsyncIterator, Iterator
+
+from asgiref.sync import sync_to_async
+from django.db.models import F
+
+from .models import Execution, Step, StepState
+from .payloads import serialize_datetime
+
+CHUNK_SIZE = 500
+
+EXECUTION_COLUMNS = ("id", "revision", "initiatedAt", "initiatedBy", "state")
+STEP_COLUMNS = (
+    "step_idx",
+    "title",
+    "type",
+    "startedAt",
+    "startedBy",
+    "doneAt",
+    "doneBy",
+)
+
+
+def _chunks(iterable, size: int):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _payloads(chunk: list[Execution], steps_of: dict) -> list[dict]:
+    """
+    The given executions, each with the state of its steps. steps_of caches
+    the steps of each revision by its id across chunks.
+    """
+    live = [e.pk for e in chunk if not e.archived]
+    states = defaultdict(dict)
+    for row in StepState.objects.filter(execution__in=live).values(
+        "execution_id", "step_id", *StepState.STATE_FIELDS
+    ):
+        states[row.pop("execution_id")][row.pop("step_id")] = row
+
+    payloads = []
+    for execution in chunk:
+        if execution.process_id not in steps_of:
+            steps_of[execution.process_id] = list(
+                Step.objects.filter(process=execution.process_id).values(
+                    "id",
+                    "position",
+                    title=F("content__title"),
+                    type=F("content__type"),
+                )
+            )
+        if execution.archived:
+            step_states = execution.snapshot_states()
+        else:
+            step_states = states[execution.pk]
+
+        payloads.append(
+            {
+                "id": str(execution.pk),
+                "revision": str(execution.process_id),
+                "initiatedAt": serialize_datetime(execution.initiatedAt),
+                "initiatedBy": execution.initiatedBy_id,
+                "state": execution.state,
+                "steps": [
+                    _step(step, step_states.get(step["id"], {}))
+                    for step in steps_of[execution.process_id]
+                ],
+            }
+        )
+    return payloads
+
+
+def execution_chunks(meta_id) -> Iterator[list[dict]]:
+    """The executions of a process, oldest first, in chunks of CHUNK_SIZE"""
+    steps_of = {}
+    queryset = (
+        Execution.objects.filter(meta=meta_id)
+        .only("id", "process", "initiatedAt", "initiatedBy", "state", "snapshot")
+        .order_by("initiatedAt", "id")
+    )
+    for chunk in _chunks(queryset.iterator(chunk_size=CHUNK_SIZE), CHUNK_SIZE):
+        yield _payloads(chunk, steps_of)
+
+
+async def executions(meta_id) -> AsyncIterator[dict]:
+    """The executions of a process, oldest first, each with the state of its steps"""
+    chunks = execution_chunks(meta_id)
+    # thread sensitive, so the cursor stays on the connection of the request
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            for execution in chunk:
+                yield execution
+    finally:
+        # e.g. the client went away, release the cursor
+        await sync_to_async(chunks.close)()
+
+
+def _step(step: dict, state: dict) -> dict:
+    return {
+        "step_idx": step["position"],
+        "title": step["title"],
+        "type": step["type"],
+        "startedAt": serialize_datetime(state.get("startedAt")),
+        "startedBy": state.get("startedBy_id"),
+        "doneAt": serialize_datetime(state.get("doneAt")),
+        "doneBy": state.get("doneBy_id"),
+    }
+
+
+async def ndjson_lines(meta_id) -> AsyncIterator[str]:
+    """One JSON document per execution"""
+    async for execution in executions(meta_id):
+        yield json.dumps(execution) + "\n"
+
+
+class _Echo:
+    """File-like object handing back what the csv writer writes to it"""
+
+    def write(self, value):
+        return value
+
+
+async def csv_lines(meta_id) -> AsyncIterator[str]:
+    """One row per step of each execution"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(
+        [f"execution_{c}" for c in EXECUTION_COLUMNS] + list(STEP_COLUMNS)
+    )
+    async for execution in executions(meta_id):
+        columns = [execution[c] for c in EXECUTION_COLUMNS]
+        for step in execution["steps"]:
+            yield writer.writerow(columns + [step[c] for c in STEP_COLUMNS])
@@ -0,0 +1,79 @@
+"""
+Sparse fieldsets, selecting the parts of a response with ?fields= and ?omit=.
+
+Both take comma-separated field names, with dots to reach into nested
+objects and lists of objects, e.g. ?omit=process.steps.description.
+Payloads are built in full and pruned afterwards, so the fast paths in
+payloads and the revision cache are the same for every fieldset.
+"""
+
+from typing import Optional
+
+from rest_framework import serializers
+
+# field name -> the fields selected within it, empty for the whole field
+Tree = dict[str, "Tree"]
+
+
+def parse(value: str) -> Tree:
+    tree = {}
+    for path in value.split(","):
+        if not path.strip():
+            continue
+        node = tree
+        for name in path.strip().split("."):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def fields_of(serializer: serializers.BaseSerializer) -> Tree:
+    """The tree of every field of the given serializer"""
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    return {
+        name: fields_of(field) if isinstance(field, serializers.BaseSerializer) else {}
+        for name, field in serializer.fields.items()
+    }
+
+
+def unknown(tree: Tree, known: Tree, prefix: str = "") -> list[str]:
+    """The paths in tree which are not in known"""
+    paths = []
+    for name, subtree in tree.items():
+        if name not in known:
+            paths.append(prefix + name)
+        else:
+            paths += unknown(subtree, known[name], f"{prefix}{name}.")
+    return paths
+
+
+def _select(data, tree: Tree):
+    if isinstance(data, list):
+        return [_select(item, tree) for item in data]
+    if not tree or not isinstance(data, dict):
+        return data
+    return {name: _select(data[name], tree[name]) for name in data if name in tree}
+
+
+def _omit(data, tree: Tree):
+    if isinstance(data, list):
+        return [_omit(item, tree) for item in data]
+    if not isinstance(data, dict):
+        return data
+    return {
+        name: _omit(value, tree[name]) if name in tree else value
+        for name, value in data.items()
+        if tree.get(name, None) != {}
+    }
+
+
+def prune(data, fields: Optional[Tree] = None, omit: Optional[Tree] = None):
+    """
+    Keep only the given fields of a payload, or a list of payloads,
+    then leave out the omitted ones
+    """
+    if fields:
+        data = _select(data, fields)
+    if omit:
+        data = _omit(data, omit)
+    return data
@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.models import Execution
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive done executions: freeze their step states into a snapshot "
+        "and move their history out of the working tables"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=30,
+            metavar="DAYS",
+            help="Only archive executions initiated at least this many days ago",
+        )
+        parser.add_argument(
+            "--limit", type=int, help="Archive at most this many executions"
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["older_than"])
+        executions = Execution.objects.filter(
+            state=Execution.ExecutionState.Done,
+            snapshot__isnull=True,
+            initiatedAt__lte=cutoff,
+        ).order_by("initiatedAt")
+        if options["limit"] is not None:
+            executions = executions[: options["limit"]]
+
+        count = 0
+        for execution in executions.iterator():
+            # each in its own transaction, so concurrent writes only wait for one
+            execution.archive()
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {count} executions"))
@@ -0,0 +1,97 @@
+import json
+import platform
+from dataclasses import fields
+from datetime import datetime, timezone
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from backend import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark query count, wall time and peak memory of every API endpoint "
+        "against seeded datasets, in a throwaway test database"
+    )
+
+    def add_arguments(self, parser):
+        for f in fields(benchmark.Dataset):
+            parser.add_argument(
+                f"--{f.name}",
+                type=int,
+                default=f.default,
+                help=f"Dataset size: {f.name} (default: {f.default})",
+            )
+        parser.add_argument(
+            "--sweep",
+            action="append",
+            default=[],
+            metavar="PARAMETER=V1,V2,...",
+            help="Vary a dataset parameter, e.g. steps=10,40,160. Can be repeated.",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--label", help="Stored in the report, e.g. a commit hash")
+        parser.add_argument("--output", help="Write the JSON report to this file")
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Fail if the query count of an endpoint grows with a swept parameter",
+        )
+
+    def parse_sweep(self, sweep: str):
+        parameter, _, values = sweep.partition("=")
+        names = [f.name for f in fields(benchmark.Dataset)]
+        if parameter not in names or not values:
+            raise CommandError(f"Invalid sweep {sweep!r}, parameters are {names}")
+        return parameter, [int(v) for v in values.split(",")]
+
+    def handle(self, *args, **options):
+        base = benchmark.Dataset(
+            **{f.name: options[f.name] for f in fields(benchmark.Dataset)}
+        )
+        sweeps = [self.parse_sweep(s) for s in options["sweep"]]
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            report = {
+                "label": options["label"],
+                "createdAt": datetime.now(timezone.utc).isoformat(),
+                "environment": {
+                    "python": platform.python_version(),
+                    "django": django.get_version(),
+                    "database": connection.vendor,
+                },
+                "base": benchmark.run_dataset(base, repeat=options["repeat"]),
+                "sweeps": [
+                    benchmark.sweep(base, parameter, values, repeat=options["repeat"])
+                    for parameter, values in sweeps
+                ],
+            }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+        growing = [
+            f"{name} ({s['parameter']}: {result['queries']})"
+            for s in report["sweeps"]
+            for name, result in s["scaling"].items()
+            if not result["flat"]
+        ]
+        if growing:
+            message = "Query count grows for " + ", ".join(growing)
+            if options["check"]:
+                raise CommandError(message)
+            self.stderr.write(self.style.WARNING(message))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from backend.models import Execution
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized step states and execution states from the history"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "executions",
+            nargs="*",
+            help="IDs of the executions to rebuild. Rebuilds all executions if omitted.",
+        )
+
+    def handle(self, *args, **options):
+        executions = Execution.objects.select_related("process")
+        if options["executions"]:
+            executions = executions.filter(pk__in=options["executions"])
+
+        count = 0
+        for execution in executions.iterator():
+            execution.rebuild_state()
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt state of {count} executions"))
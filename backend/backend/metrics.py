@@ -0,0 +1,85 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+# upper bounds of the histogram buckets, the Prometheus client defaults
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float):
+        # the bucket index of the smallest upper bound >= value, +Inf otherwise
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Histograms of request metrics, labelled by view and method.
+    Kept in memory, so every server process reports its own requests.
+    """
+
+    METRICS = {
+        "prapp_request_duration_seconds": ("Total request latency", DURATION_BUCKETS),
+        "prapp_request_db_duration_seconds": (
+            "Time spent executing queries",
+            DURATION_BUCKETS,
+        ),
+        "prapp_request_db_queries": ("Number of queries executed", QUERY_BUCKETS),
+        "prapp_request_serialize_duration_seconds": (
+            "Time spent building the response payload",
+            DURATION_BUCKETS,
+        ),
+        "prapp_request_render_duration_seconds": (
+            "Time spent rendering the response body",
+            DURATION_BUCKETS,
+        ),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: dict[str, dict[tuple, Histogram]] = defaultdict(dict)
+
+    def observe(self, name: str, labels: tuple[tuple[str, str], ...], value: float):
+        with self._lock:
+            histograms = self._histograms[name]
+            if labels not in histograms:
+                histograms[labels] = Histogram(self.METRICS[name][1])
+            histograms[labels].observe(value)
+
+    def render(self) -> str:
+        """The histograms in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (description, _) in self.METRICS.items():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(self._histograms[name].items()):
+                    lines += self._render_histogram(name, labels, histogram)
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(name: str, labels: tuple, histogram: Histogram):
+        label_str = ",".join(f'{k}="{escape(v)}"' for k, v in labels)
+        cumulative = 0
+        bounds = [str(b) for b in histogram.buckets] + ["+Inf"]
+        for bound, count in zip(bounds, histogram.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{label_str},le="{bound}"}} {cumulative}'
+        yield f"{name}_sum{{{label_str}}} {histogram.sum}"
+        yield f"{name}_count{{{label_str}}} {histogram.count}"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
@@ -0,0 +1,262 @@
+import gzip
+import re
+import time
+import zlib
+from typing import Optional
+
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .metrics import registry
+from .profiling import RequestProfile, profiling
+
+
+class ProfilingMiddleware:
+    """
+    Measures query count and time, serialization time, render time and total
+    latency of each request. They are reported in the Server-Timing header
+    of the response and aggregated into the histograms served by the
+    metrics endpoint.
+
+    Serialization covers building the payloads of responses, with the
+    payload builders or the serializers, see profiling.serializing.
+    Render time covers turning a DRF response into its body.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # adapted to the sync mode otherwise, with a switch to a thread
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        profile = request.profile = RequestProfile()
+        start = time.perf_counter()
+        with profiling(profile):
+            response = self.get_response(request)
+        return self.report(request, response, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        profile = request.profile = RequestProfile()
+        start = time.perf_counter()
+        with profiling(profile):
+            response = await self.get_response(request)
+        return self.report(request, response, time.perf_counter() - start)
+
+    def report(self, request, response, total: float):
+        profile = request.profile
+        app = total - profile.db - profile.serialize - profile.render
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={profile.db * 1000:.2f};desc="{profile.queries} queries"',
+                f"serialize;dur={profile.serialize * 1000:.2f}",
+                f"render;dur={profile.render * 1000:.2f}",
+                f"app;dur={app * 1000:.2f}",
+                f"total;dur={total * 1000:.2f}",
+            ]
+        )
+
+        match = request.resolver_match
+        labels = (
+            ("view", match.view_name if match else "unmatched"),
+            ("method", request.method),
+        )
+        registry.observe("prapp_request_duration_seconds", labels, total)
+        registry.observe("prapp_request_db_duration_seconds", labels, profile.db)
+        registry.observe("prapp_request_db_queries", labels, profile.queries)
+        registry.observe(
+            "prapp_request_serialize_duration_seconds", labels, profile.serialize
+        )
+        registry.observe(
+            "prapp_request_render_duration_seconds", labels, profile.render
+        )
+
+        return response
+
+    def process_template_response(self, request, response):
+        return self._time_render(request, response)
+
+    async def aprocess_template_response(self, request, response):
+        return self._time_render(request, response)
+
+    def _time_render(self, request, response):
+        # DRF responses get rendered right after this hook
+        request.profile.start_render()
+        response.add_post_render_callback(request.profile.end_render)
+        return response
+
+
+# not text/html: pages with a CSRF token would be open to BREACH
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/vnd.oai.openapi",
+    "text/csv",
+    "text/plain",
+)
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    """The content codings accepted by an Accept-Encoding header, by name"""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip().removeprefix("q=")
+        try:
+            if params and float(q) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _gzip(content: bytes) -> bytes:
+    # the level of GZipMiddleware
+    return gzip.compress(content, compresslevel=6, mtime=0)
+
+
+class _GzipStream:
+    """Compresses a stream item by item, flushing each so none is held back"""
+
+    def __init__(self):
+        # a gzip header and trailer around the deflate stream
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, item: bytes) -> bytes:
+        return self.compressor.compress(item) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self):
+        self.compressor = brotli.Compressor()
+
+    def compress(self, item: bytes) -> bytes:
+        return self.compressor.process(item) + self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+def _compress_stream(stream, compressor):
+    for item in stream:
+        if data := compressor.compress(item):
+            yield data
+    yield compressor.finish()
+
+
+async def _acompress_stream(stream, compressor):
+    async for item in stream:
+        if data := compressor.compress(item):
+            yield data
+    yield compressor.finish()
+
+
+# content coding -> compression of a body, and compressor of a stream,
+# in order of preference
+CODINGS = {
+    "br": (brotli.compress, _BrotliStream),
+    "gzip": (_gzip, _GzipStream),
+}
+
+# the coding suffix of an ETag of a compressed response, e.g. "<revision>-gzip"
+_ETAG_CODING = re.compile(r'-(%s)"' % "|".join(CODINGS))
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses of the compressible types with brotli or gzip,
+    as accepted by the client, see CODINGS. Responses smaller than
+    COMPRESSION_MIN_SIZE bytes are sent as they are, since compressing them
+    saves less than it costs.
+
+    Strong ETags identify the exact bytes of a response, so those of
+    compressed responses get the coding as a suffix. The suffix is stripped
+    from If-Match and If-None-Match before the views compare them with the
+    revision or the point in the history of an execution they identify.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        coding = self.strip_etag_coding(request)
+        return self.compress(request, self.get_response(request), coding)
+
+    async def __acall__(self, request):
+        coding = self.strip_etag_coding(request)
+        return self.compress(request, await self.get_response(request), coding)
+
+    def strip_etag_coding(self, request) -> Optional[str]:
+        """
+        Strip the coding suffix from the ETags of the conditional headers.
+        Returns the coding of If-None-Match, for the ETag of a 304 response.
+        """
+        match = _ETAG_CODING.search(request.META.get("HTTP_IF_NONE_MATCH", ""))
+        for header in ("HTTP_IF_MATCH", "HTTP_IF_NONE_MATCH"):
+            if header in request.META:
+                request.META[header] = _ETAG_CODING.sub('"', request.META[header])
+        return match and match[1]
+
+    def compress(self, request, response, etag_coding=None):
+        if response.status_code == 304:
+            # stands for the response the client has, in its coding
+            if etag_coding is not None:
+                self.code_etag(response, etag_coding)
+            return response
+
+        content_type = response.get("Content-Type", "").split(";")[0].strip()
+        if content_type not in COMPRESSIBLE_TYPES:
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if response.has_header("Content-Encoding"):
+            return response
+        if (
+            not response.streaming
+            and len(response.content) < settings.COMPRESSION_MIN_SIZE
+        ):
+            return response
+
+        accepted = _accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        coding = next((c for c in CODINGS if c in accepted), None)
+        if coding is None:
+            return response
+
+        compress, stream_compressor = CODINGS[coding]
+        if response.streaming:
+            stream = _acompress_stream if response.is_async else _compress_stream
+            response.streaming_content = stream(
+                response.streaming_content, stream_compressor()
+            )
+            del response["Content-Length"]
+        else:
+            response.content = compress(response.content)
+            response["Content-Length"] = str(len(response.content))
+
+        response["Content-Encoding"] = coding
+        self.code_etag(response, coding)
+        return response
+
+    def code_etag(self, response, coding: str):
+        etag = response.get("ETag")
+        if etag and not etag.startswith("W/"):
+            response["ETag"] = f'{etag[:-1]}-{coding}"'
@@ -0,0 +1,112 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def materialize_state(apps, schema_editor):
+    """Replay the history of every execution into the new state table and column"""
+    Execution = apps.get_model("backend", "Execution")
+    Step = apps.get_model("backend", "Step")
+    StepState = apps.get_model("backend", "StepState")
+
+    for execution in Execution.objects.iterator():
+        states = {}
+        for item in execution.history.order_by("at", "id"):
+            state = states.setdefault(
+                item.step_id, StepState(execution=execution, step_id=item.step_id)
+            )
+            if item.type == "StepStarted":
+                state.startedAt, state.startedBy_id = item.at, item.by_id
+            else:
+                state.doneAt, state.doneBy_id = item.at, item.by_id
+        StepState.objects.bulk_create(states.values())
+
+        step_ids = Step.objects.filter(
+            process=execution.process_id, type="ST"
+        ).values_list("id", flat=True)
+        done = all(
+            (s := states.get(step_id)) is not None and s.startedAt and s.doneAt
+            for step_id in step_ids
+        )
+        execution.state = "done" if done else "started"
+        execution.save(update_fields=["state"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="execution",
+            name="state",
+            field=models.CharField(
+                choices=[("started", "Started"), ("done", "Done")],
+                default="started",
+                max_length=16,
+            ),
+        ),
+        migrations.CreateModel(
+            name="StepState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("startedAt", models.DateTimeField(blank=True, null=True)),
+                ("doneAt", models.DateTimeField(blank=True, null=True)),
+                (
+                    "doneBy",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "execution",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="step_states",
+                        to="backend.execution",
+                    ),
+                ),
+                (
+                    "startedBy",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "step",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="states",
+                        to="backend.step",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="stepstate",
+            constraint=models.UniqueConstraint(
+                fields=("execution", "step"), name="unique_step_state"
+            ),
+        ),
+        migrations.RunPython(materialize_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def set_current_revisions(apps, schema_editor):
+    Meta = apps.get_model("backend", "Meta")
+    for meta in Meta.objects.iterator():
+        meta.current_revision = meta.revisions.order_by("-createdAt").first()
+        meta.save(update_fields=["current_revision"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0002_execution_state"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="meta",
+            name="current_revision",
+            field=models.OneToOneField(
+                blank=True,
+                db_comment="Latest revision, maintained by Process.save",
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="current_of",
+                to="backend.process",
+            ),
+        ),
+        migrations.RunPython(set_current_revisions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+
+def number_steps(apps, schema_editor):
+    """Steps were implicitly ordered by insertion, i.e. by their id"""
+    Step = apps.get_model("backend", "Step")
+    Process = apps.get_model("backend", "Process")
+
+    for process in Process.objects.iterator():
+        steps = list(Step.objects.filter(process=process).order_by("id"))
+        for position, step in enumerate(steps):
+            step.position = position
+        Step.objects.bulk_update(steps, ["position"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0003_current_revision"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="step",
+            name="position",
+            field=models.PositiveIntegerField(
+                db_comment="Index of the step within its process revision",
+                default=0,
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(number_steps, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name="step",
+            options={"ordering": ["position"]},
+        ),
+        migrations.AddConstraint(
+            model_name="step",
+            constraint=models.UniqueConstraint(
+                fields=("process", "position"), name="unique_step_position"
+            ),
+        ),
+    ]
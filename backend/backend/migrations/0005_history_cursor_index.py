@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0004_step_position"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="historyitem",
+            index=models.Index(
+                fields=["execution", "id"], name="history_execution_cursor"
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def denormalize_meta(apps, schema_editor):
+    Execution = apps.get_model("backend", "Execution")
+    Process = apps.get_model("backend", "Process")
+    Execution.objects.update(
+        meta=Subquery(
+            Process.objects.filter(revision=OuterRef("process")).values("meta")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    # PostgreSQL can't alter a table with pending trigger events, as left by
+    # updating its rows in the same transaction. The rows get updated in a
+    # transaction of their own, see RunPython.
+    atomic = False
+
+    dependencies = [
+        ("backend", "0005_history_cursor_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="execution",
+            name="meta",
+            field=models.ForeignKey(
+                db_comment="Denormalized process.meta, for listing the executions of a process",
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="executions",
+                to="backend.meta",
+            ),
+        ),
+        migrations.RunPython(denormalize_meta, migrations.RunPython.noop, atomic=True),
+        migrations.AlterField(
+            model_name="execution",
+            name="meta",
+            field=models.ForeignKey(
+                db_comment="Denormalized process.meta, for listing the executions of a process",
+                editable=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="executions",
+                to="backend.meta",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="execution",
+            index=models.Index(
+                fields=["meta", "-initiatedAt", "-id"], name="execution_listing"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="historyitem",
+            index=models.Index(
+                fields=["step", "execution", "type", "-at"], name="history_step_lookup"
+            ),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:50
+
+import math
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def rollup_durations(apps, schema_editor):
+    """Replay the history of every execution, archived or not, into the rollups"""
+    HistoryItem = apps.get_model("backend", "HistoryItem")
+    ArchivedHistoryItem = apps.get_model("backend", "ArchivedHistoryItem")
+    StepDurationBucket = apps.get_model("backend", "StepDurationBucket")
+
+    buckets = {}
+    for model in (HistoryItem, ArchivedHistoryItem):
+        execution_id = None
+        items = model.objects.order_by("execution_id", "id")
+        for item in items.values("execution_id", "step_id", "type", "at").iterator():
+            if item["execution_id"] != execution_id:
+                execution_id, started, done = item["execution_id"], {}, {}
+
+            key = item["step_id"]
+            if item["type"] == "StepStarted":
+                started[key] = item["at"]
+                continue
+
+            if key in started and (key not in done or done[key] < started[key]):
+                seconds = max((item["at"] - started[key]).total_seconds(), 0)
+                bucket = 0 if seconds < 1 else math.floor(math.log2(seconds) * 4) + 1
+                count, max_seconds = buckets.get((item["step_id"], bucket), (0, 0))
+                buckets[item["step_id"], bucket] = (
+                    count + 1,
+                    max(max_seconds, seconds),
+                )
+            done[key] = item["at"]
+
+    StepDurationBucket.objects.bulk_create(
+        StepDurationBucket(
+            step_id=step_id, bucket=bucket, count=count, max_seconds=max_seconds
+        )
+        for (step_id, bucket), (count, max_seconds) in buckets.items()
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0007_history_archive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StepDurationBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket", models.PositiveSmallIntegerField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "max_seconds",
+                    models.FloatField(
+                        db_comment="Longest duration within the bucket, for an exact maximum"
+                    ),
+                ),
+                (
+                    "step",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="durations",
+                        to="backend.step",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="stepdurationbucket",
+            constraint=models.UniqueConstraint(
+                fields=("step", "bucket"), name="unique_step_duration_bucket"
+            ),
+        ),
+        migrations.RunPython(rollup_durations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0008_step_durations"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="execution",
+            index=models.Index(
+                fields=["meta", "state", "-initiatedAt", "-id"],
+                name="execution_state_listing",
+            ),
+        ),
+    ]
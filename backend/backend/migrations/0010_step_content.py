@@ -0,0 +1,154 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:07
+
+import hashlib
+import json
+from itertools import islice
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FIELDS = ("title", "type", "description", "startWithPrevious")
+
+
+def _digest(fields):
+    data = json.dumps([fields[f] for f in FIELDS], separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def intern_contents(apps, schema_editor):
+    """Move the fields of every step into a content shared by identical steps"""
+    Step = apps.get_model("backend", "Step")
+    StepContent = apps.get_model("backend", "StepContent")
+
+    ids = {}
+    rows = Step.objects.order_by("id").values("id", *FIELDS).iterator()
+    while chunk := list(islice(rows, 1000)):
+        contents = {}
+        for row in chunk:
+            row["hash"] = _digest(row)
+            if row["hash"] not in ids:
+                contents[row["hash"]] = {f: row[f] for f in FIELDS}
+
+        StepContent.objects.bulk_create(
+            StepContent(hash=h, **fields) for h, fields in contents.items()
+        )
+        ids.update(
+            StepContent.objects.filter(hash__in=contents).values_list("hash", "id")
+        )
+        Step.objects.bulk_update(
+            [Step(id=row["id"], content_id=ids[row["hash"]]) for row in chunk],
+            ["content"],
+        )
+
+
+def restore_fields(apps, schema_editor):
+    Step = apps.get_model("backend", "Step")
+    steps = list(Step.objects.select_related("content"))
+    for step in steps:
+        for f in FIELDS:
+            setattr(step, f, getattr(step.content, f))
+    Step.objects.bulk_update(steps, FIELDS, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    # PostgreSQL can't alter a table with pending trigger events, as left by
+    # updating its rows in the same transaction. The rows get updated in a
+    # transaction of their own, see RunPython.
+    atomic = False
+
+    dependencies = [
+        ("backend", "0009_execution_state_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StepContent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "hash",
+                    models.CharField(
+                        db_comment="SHA-256 of the fields, see StepContent.digest",
+                        editable=False,
+                        max_length=64,
+                        unique=True,
+                    ),
+                ),
+                ("title", models.CharField(max_length=200)),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[("SE", "Section"), ("ST", "Step")], max_length=2
+                    ),
+                ),
+                ("description", models.TextField(blank=True)),
+                (
+                    "startWithPrevious",
+                    models.BooleanField(
+                        blank=True,
+                        db_comment="Automatically start this step when the previous one gets marked as done",
+                        default=False,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="step",
+            name="content",
+            field=models.ForeignKey(
+                db_comment="Shared by the steps of all revisions with the same content",
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="steps",
+                to="backend.stepcontent",
+            ),
+        ),
+        migrations.RunPython(intern_contents, restore_fields, atomic=True),
+        migrations.AlterField(
+            model_name="step",
+            name="content",
+            field=models.ForeignKey(
+                db_comment="Shared by the steps of all revisions with the same content",
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="steps",
+                to="backend.stepcontent",
+            ),
+        ),
+        # defaults for the columns re-added when migrating backwards
+        migrations.AlterField(
+            model_name="step",
+            name="title",
+            field=models.CharField(default="", max_length=200),
+        ),
+        migrations.AlterField(
+            model_name="step",
+            name="type",
+            field=models.CharField(
+                choices=[("SE", "Section"), ("ST", "Step")], default="", max_length=2
+            ),
+        ),
+        migrations.RemoveField(
+            model_name="step",
+            name="description",
+        ),
+        migrations.RemoveField(
+            model_name="step",
+            name="startWithPrevious",
+        ),
+        migrations.RemoveField(
+            model_name="step",
+            name="title",
+        ),
+        migrations.RemoveField(
+            model_name="step",
+            name="type",
+        ),
+    ]
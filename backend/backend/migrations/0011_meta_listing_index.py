@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 21:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0010_step_content"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="meta",
+            index=models.Index(fields=["createdAt", "id"], name="meta_listing"),
+        ),
+    ]
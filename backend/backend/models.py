@@ -1,21 +1,54 @@
-from datetime import datetime
-from typing import Optional
+from collections import defaultdict
+import hashlib
+import json
+import math
+from datetime import datetime, timedelta
+from functools import cached_property
+from typing import Iterable, Optional
 import uuid
-from django.db import models
+from django.db import connections, models, router, transaction
 from django.conf import settings
 from dataclasses import dataclass
 from django.contrib.auth.models import User
+from django.db.models import Max
+from django.db.models.signals import post_save
+from django.db.models.functions import Coalesce
 from django.db.models.query import QuerySet
 
+from .caching import invalidate_revision
+
+
+def _format_datetime(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value is not None else None
+
 
 class Meta(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     createdBy = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     createdAt = models.DateTimeField(auto_now_add=True)
+    current_revision = models.OneToOneField(
+        "Process",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="current_of",
+        db_comment="Latest revision, maintained by Process.save",
+    )
+
+    class Meta:
+        indexes = [
+            # serves the process list, see ProcessCursorPagination
+            models.Index(fields=["createdAt", "id"], name="meta_listing"),
+        ]
 
     @property
     def latest_revision(self):
-        return self.revisions.order_by("-createdAt").first()
+        return self.current_revision
 
 
 class Process(models.Model):
@@ -28,6 +61,25 @@ class Process(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # revisions are immutable, so the newest one is the current one
+            if adding:
+                Meta.objects.filter(pk=self.meta_id).update(current_revision=self)
+                if Process.meta.is_cached(self):
+                    self.meta.current_revision = self
+            else:
+                # only happens when a revision is edited in the admin
+                invalidate_revision(self.revision)
+
+
+class StepManager(models.Manager):
+    def get_queryset(self):
+        # the content is needed wherever steps are loaded as instances
+        return super().get_queryset().select_related("content")
+
 
 class Step(models.Model):
     class Type(models.TextChoices):
@@ -41,8 +93,81 @@ class Step(models.Model):
         doneAt: Optional[datetime] = None
         doneBy: Optional[User] = None
 
+    objects = StepManager()
+
+    process = models.ForeignKey(Process, on_delete=models.CASCADE, related_name="steps")
+    position = models.PositiveIntegerField(
+        db_comment="Index of the step within its process revision"
+    )
+    content = models.ForeignKey(
+        "StepContent",
+        on_delete=models.PROTECT,
+        related_name="steps",
+        db_comment="Shared by the steps of all revisions with the same content",
+    )
+
+    class Meta:
+        ordering = ["position"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["process", "position"], name="unique_step_position"
+            )
+        ]
+
+    @property
+    def title(self) -> str:
+        return self.content.title
+
+    @property
+    def type(self) -> str:
+        return self.content.type
+
+    @property
+    def description(self) -> str:
+        return self.content.description
+
+    @property
+    def startWithPrevious(self) -> bool:
+        return self.content.startWithPrevious
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # steps are only saved one by one when edited in the admin
+        invalidate_revision(self.process_id)
+
+    def delete(self, *args, **kwargs):
+        invalidate_revision(self.process_id)
+        return super().delete(*args, **kwargs)
+
+    def history(
+        self, execution: "Execution", type: Optional[str] = None
+    ) -> QuerySet["HistoryItem"]:
+        history = execution.history_items().filter(step=self)
+        if type is not None:
+            history = history.filter(type=type)
+        return history.order_by("-at")
+
+    def execution_info(self, execution: "Execution"):
+        return execution.step_infos.get(self.pk, Step.ExecutionInfo())
+
+
+class StepContent(models.Model):
+    """
+    Title, type, description and flags of a step, stored once for all the
+    revisions that contain it. Contents are immutable and found through the
+    hash of their fields, see intern().
+    """
+
+    FIELDS = ("title", "type", "description", "startWithPrevious")
+
+    hash = models.CharField(
+        max_length=64,
+        unique=True,
+        editable=False,
+        db_comment="SHA-256 of the fields, see StepContent.digest",
+    )
     title = models.CharField(max_length=200)
-    type = models.CharField(max_length=2, choices=Type.choices)
+    type = models.CharField(max_length=2, choices=Step.Type.choices)
     description = models.TextField(blank=True)
     startWithPrevious = models.BooleanField(
         default=False,
@@ -50,24 +175,50 @@ class Step(models.Model):
         db_comment="Automatically start this step when the previous one gets marked as done",
     )
 
-    process = models.ForeignKey(Process, on_delete=models.CASCADE, related_name="steps")
-
-    def history(self, execution: "Execution") -> QuerySet["HistoryItem"]:
-        return self.historyitem_set.filter(execution=execution).order_by("-at")
+    def __str__(self):
+        return self.title
 
-    def execution_info(self, execution: "Execution"):
-        history = self.history(execution)
-        info = Step.ExecutionInfo()
+    @classmethod
+    def normalize(cls, fields: dict) -> dict:
+        """The fields of a content, with defaults for the missing ones"""
+        return {
+            f: fields[f] if f in fields else cls._meta.get_field(f).get_default()
+            for f in cls.FIELDS
+        }
 
-        if (started := history.filter(type="StepStarted").first()) is not None:
-            info.startedAt = started.at
-            info.startedBy = started.by
+    @classmethod
+    def digest(cls, fields: dict) -> str:
+        data = json.dumps([fields[f] for f in cls.FIELDS], separators=(",", ":"))
+        return hashlib.sha256(data.encode()).hexdigest()
 
-        if (done := history.filter(type="StepDone").first()) is not None:
-            info.doneAt = done.at
-            info.doneBy = done.by
+    @classmethod
+    def intern(cls, steps: list[dict]) -> list[int]:
+        """
+        Ids of the contents with the fields of the given steps, in order.
+        Contents that don't exist yet are created, the others are reused.
+        """
+        contents = {}
+        hashes = []
+        for step in steps:
+            fields = cls.normalize(step)
+            hashes.append(cls.digest(fields))
+            contents[hashes[-1]] = fields
+        if not contents:
+            return []
 
-        return info
+        ids = dict(cls.objects.filter(hash__in=contents).values_list("hash", "id"))
+        missing = [
+            cls(hash=h, **fields) for h, fields in contents.items() if h not in ids
+        ]
+        if missing:
+            # contents created concurrently are picked up by the query below
+            cls.objects.bulk_create(missing, ignore_conflicts=True)
+            ids.update(
+                cls.objects.filter(hash__in=[c.hash for c in missing]).values_list(
+                    "hash", "id"
+                )
+            )
+        return [ids[h] for h in hashes]
 
 
 class Execution(models.Model):
@@ -75,6 +226,13 @@ class Execution(models.Model):
         Started = "started"
         Done = "done"
 
+    class InvalidStep(ValueError):
+        """An operation referenced a step that does not exist or is not of type ST"""
+
+        def __init__(self, operation: int):
+            super().__init__(f"Invalid step in operation {operation}")
+            self.operation = operation
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
 
     initiatedBy = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -82,15 +240,427 @@ class Execution(models.Model):
     process = models.ForeignKey(
         Process, on_delete=models.CASCADE, related_name="executions"
     )
+    meta = models.ForeignKey(
+        Meta,
+        on_delete=models.CASCADE,
+        related_name="executions",
+        editable=False,
+        db_comment="Denormalized process.meta, for listing the executions of a process",
+    )
+
+    state = models.CharField(
+        max_length=16, choices=ExecutionState.choices, default=ExecutionState.Started
+    )
+    snapshot = models.JSONField(
+        null=True,
+        blank=True,
+        editable=False,
+        db_comment="Step states of an archived execution, see Execution.archive",
+    )
+
+    class Meta:
+        indexes = [
+            # serves the executions of a process, see ProcessViewSet.executions
+            models.Index(
+                fields=["meta", "-initiatedAt", "-id"], name="execution_listing"
+            ),
+            # serves the executions of a process in a state, e.g. the open ones
+            models.Index(
+                fields=["meta", "state", "-initiatedAt", "-id"],
+                name="execution_state_listing",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        # meta follows the process, which can be changed in the admin
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "process" in update_fields:
+            self.meta_id = self.process.meta_id
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "meta"}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def start_many(cls, process: Process, by: User, count: int) -> list["Execution"]:
+        """
+        Start count executions of the given revision, with batched inserts.
+        The first step of type ST gets started right away if it has startWithPrevious.
+        """
+        first_step = (
+            process.steps.filter(content__type=Step.Type.Step)
+            .only("id", "content__startWithPrevious")
+            .first()
+        )
+        state = cls.ExecutionState.Started if first_step else cls.ExecutionState.Done
+
+        with transaction.atomic():
+            # bulk_create skips save(), which fills in meta
+            executions = cls.objects.bulk_create(
+                cls(
+                    process=process,
+                    meta_id=process.meta_id,
+                    initiatedBy=by,
+                    state=state,
+                )
+                for _ in range(count)
+            )
+            if first_step is not None and first_step.startWithPrevious:
+                items = HistoryItem.objects.bulk_create(
+                    HistoryItem(
+                        execution=execution,
+                        type=HistoryItem.Type.StepStarted,
+                        step=first_step,
+                        by=by,
+                    )
+                    for execution in executions
+                )
+                StepState.objects.bulk_create(
+                    StepState(
+                        execution=item.execution,
+                        step=first_step,
+                        startedAt=item.at,
+                        startedBy=by,
+                    )
+                    for item in items
+                )
+
+        return executions
 
     @property
-    def state(self):
-        steps = self.process.steps.filter(type="ST")
-        info = [s.execution_info(self) for s in steps]
+    def archived(self) -> bool:
+        return self.snapshot is not None
+
+    @cached_property
+    def step_infos(self) -> dict[int, Step.ExecutionInfo]:
+        """
+        The started/done info of each step, keyed by step id.
+        Read from the materialized step states with a single query.
+        """
+        if self.archived:
+            states = self.snapshot_states()
+            users = User.objects.in_bulk(
+                {s[f] for s in states.values() for f in ("startedBy_id", "doneBy_id")}
+            )
+            return {
+                step_id: Step.ExecutionInfo(
+                    s["startedAt"],
+                    users.get(s["startedBy_id"]),
+                    s["doneAt"],
+                    users.get(s["doneBy_id"]),
+                )
+                for step_id, s in states.items()
+            }
+
+        states = self.step_states.select_related("startedBy", "doneBy")
+        return {
+            s.step_id: Step.ExecutionInfo(s.startedAt, s.startedBy, s.doneAt, s.doneBy)
+            for s in states
+        }
+
+    def snapshot_states(self) -> dict[int, dict]:
+        """
+        The step states frozen in the snapshot of an archived execution, keyed
+        by step id, like StepState.objects.values(*StepState.STATE_FIELDS)
+        """
+        return {
+            int(step_id): {
+                "startedAt": _parse_datetime(state["startedAt"]),
+                "startedBy_id": state["startedBy_id"],
+                "doneAt": _parse_datetime(state["doneAt"]),
+                "doneBy_id": state["doneBy_id"],
+            }
+            for step_id, state in self.snapshot["steps"].items()
+        }
+
+    def history_items(self) -> QuerySet:
+        """The history of this execution, read from the archive once archived"""
+        return self.archived_history.all() if self.archived else self.history.all()
+
+    def replay_history(self) -> dict[int, Step.ExecutionInfo]:
+        """
+        Fold the whole history of this execution into the started/done info
+        of each step, keyed by step id. This costs a single query,
+        regardless of the number of steps.
+        """
+        infos = defaultdict(Step.ExecutionInfo)
+        # items of an execution are written one at a time, see record(),
+        # so their ids are in the same order as their timestamps
+        history = self.history_items().select_related("by").order_by("id")
+
+        # later items overwrite earlier ones, so the most recent item wins
+        for item in history:
+            info = infos[item.step_id]
+            if item.type == HistoryItem.Type.StepStarted:
+                info.startedAt = item.at
+                info.startedBy = item.by
+            elif item.type == HistoryItem.Type.StepDone:
+                info.doneAt = item.at
+                info.doneBy = item.by
+
+        return dict(infos)
 
-        if all([(i.startedAt is not None) and (i.doneAt is not None) for i in info]):
-            return "done"
-        return "started"
+    def lock(self, restore: bool = True):
+        """
+        Serialize concurrent writes to this execution, until the transaction ends.
+        An archived execution gets restored, so it can be written to,
+        unless restore is False.
+        """
+        self.snapshot = (
+            Execution.objects.select_for_update()
+            .values_list("snapshot", flat=True)
+            .get(pk=self.pk)
+        )
+        self.__dict__.pop("step_infos", None)
+        if self.archived and restore:
+            self._restore()
+
+    def archive(self):
+        """
+        Freeze the step states of a done execution into its snapshot,
+        and move its history into the archive
+        """
+        with transaction.atomic():
+            self.lock()
+            if self.state != self.ExecutionState.Done:
+                raise ValueError("Only done executions can be archived")
+
+            states = self.step_states.values("step_id", *StepState.STATE_FIELDS)
+            self._freeze(states)
+            self.step_states.all().delete()
+            self._move_history(HistoryItem, ArchivedHistoryItem)
+            self.__dict__.pop("step_infos", None)
+
+    def _freeze(self, states: Iterable[dict]):
+        """
+        Save the given step states, like StepState.objects.values("step_id",
+        *StepState.STATE_FIELDS), as the snapshot of this execution
+        """
+        self.snapshot = {
+            "steps": {
+                str(s["step_id"]): {
+                    "startedAt": _format_datetime(s["startedAt"]),
+                    "startedBy_id": s["startedBy_id"],
+                    "doneAt": _format_datetime(s["doneAt"]),
+                    "doneBy_id": s["doneBy_id"],
+                }
+                for s in states
+            },
+        }
+        self.save(update_fields=["snapshot"])
+
+    def _move_history(self, source: type[models.Model], target: type[models.Model]):
+        """
+        Move the history items of this execution between the HistoryItem and
+        ArchivedHistoryItem tables with INSERT ... SELECT, keeping them as they are
+        """
+        db = router.db_for_write(target, instance=self)
+        connection = connections[db]
+        quote = connection.ops.quote_name
+        columns = ", ".join(quote(c) for c in ArchivedHistoryItem.COLUMNS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(target._meta.db_table)} ({columns}) "
+                f"SELECT {columns} FROM {quote(source._meta.db_table)} "
+                f"WHERE {quote('execution_id')} = %s",
+                [self._meta.pk.get_db_prep_value(self.pk, connection)],
+            )
+        source.objects.using(db).filter(execution=self).delete()
+
+    def _restore(self):
+        """Move an archived execution back into the working tables. Requires lock()"""
+        StepState.objects.bulk_create(
+            StepState(execution=self, step_id=step_id, **state)
+            for step_id, state in self.snapshot_states().items()
+        )
+        # no post_save is sent, so restored items are not broadcast again
+        self._move_history(ArchivedHistoryItem, HistoryItem)
+
+        self.snapshot = None
+        self.save(update_fields=["snapshot"])
+        self.__dict__.pop("step_infos", None)
+
+    def record(self, type: "HistoryItem.Type", step: Step, by: User) -> "HistoryItem":
+        """
+        Append an item to the history and update the materialized state
+        of the step and the execution in the same transaction
+        """
+        durations = []
+        with transaction.atomic():
+            self.lock()
+            item = HistoryItem(execution=self, type=type, step=step, by=by)
+            self._append([item], durations)
+            self.update_state()
+            StepDurationBucket.record(durations)
+        return item
+
+    def _append(
+        self, items: list["HistoryItem"], durations: list[tuple[int, timedelta]]
+    ):
+        """
+        Append items to the history and update the states of their steps, with
+        a query each whatever the number of items. Requires lock()
+        Adds the durations of the steps the items complete to durations.
+        """
+        HistoryItem.objects.bulk_create(items)
+
+        # read once under the lock, then kept in sync with the step states
+        infos = self.step_infos
+        changed = {}
+        for item in items:
+            info = changed[item.step_id] = infos.setdefault(
+                item.step_id, Step.ExecutionInfo()
+            )
+            if item.type == HistoryItem.Type.StepStarted:
+                info.startedAt, info.startedBy = item.at, item.by
+            else:
+                # done for the first time since the step was started
+                if info.startedAt and not (
+                    info.doneAt and info.doneAt >= info.startedAt
+                ):
+                    durations.append((item.step_id, item.at - info.startedAt))
+                info.doneAt, info.doneBy = item.at, item.by
+
+        StepState.objects.bulk_create(
+            [
+                StepState(
+                    execution=self,
+                    step_id=step_id,
+                    startedAt=info.startedAt,
+                    startedBy=info.startedBy,
+                    doneAt=info.doneAt,
+                    doneBy=info.doneBy,
+                )
+                for step_id, info in changed.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["execution", "step"],
+            update_fields=["startedAt", "startedBy", "doneAt", "doneBy"],
+        )
+
+        # bulk_create doesn't send it, see broadcast_history_item
+        for item in items:
+            post_save.send(
+                HistoryItem,
+                instance=item,
+                created=True,
+                raw=False,
+                using=self._state.db,
+            )
+
+    def mark_steps(
+        self, operations: list[tuple[int, "HistoryItem.Type"]], by: User
+    ) -> list[Step]:
+        """
+        Mark steps as started or done, given as (step_idx, mark_as) operations
+        that are applied in order, within a single transaction.
+        Returns the steps whose state changed, ordered by position.
+        Raises InvalidStep (and writes nothing) if any index is invalid.
+        """
+        steps = list(self.process.steps.all())
+        changed = {}
+        items = []
+        durations = []
+
+        with transaction.atomic():
+            self.lock()
+            for operation, (step_idx, mark_as) in enumerate(operations):
+                if not (0 <= step_idx < len(steps)) or steps[step_idx].type != "ST":
+                    raise Execution.InvalidStep(operation)
+
+                # the history item where the step gets marked as "started" or "done"
+                step = steps[step_idx]
+                items.append(
+                    HistoryItem(execution=self, type=mark_as, step=step, by=by)
+                )
+                changed[step.pk] = step
+
+                # get the following step
+                following_steps = steps[(step_idx + 1) :]
+                next_step = next((s for s in following_steps if s.type == "ST"), None)
+
+                # the next step might have "startWithPrevious" set
+                # if that's the case and the current step is marked as done
+                # we shall mark the following step as started
+                if (
+                    (mark_as == "StepDone")
+                    and (next_step is not None)
+                    and (next_step.startWithPrevious)
+                ):
+                    items.append(
+                        HistoryItem(
+                            execution=self, type="StepStarted", step=next_step, by=by
+                        )
+                    )
+                    changed[next_step.pk] = next_step
+
+            self._append(items, durations)
+            self.update_state()
+            StepDurationBucket.record(durations)
+
+        return sorted(changed.values(), key=lambda s: s.position)
+
+    def update_state(self):
+        """
+        Recompute the stored state from the materialized step states.
+        The execution is done once every step of type ST was started and done.
+        """
+        complete = self.step_states.filter(
+            startedAt__isnull=False, doneAt__isnull=False
+        ).values("step_id")
+        pending = (
+            self.process.steps.filter(content__type=Step.Type.Step)
+            .exclude(pk__in=complete)
+            .exists()
+        )
+
+        state = self.ExecutionState.Started if pending else self.ExecutionState.Done
+        if state != self.state:
+            self.state = state
+            self.save(update_fields=["state"])
+
+    def rebuild_state(self):
+        """
+        Rebuild the materialized step states and the stored state from the
+        history. An archived execution stays archived, with its snapshot
+        rebuilt from the archived history instead.
+        """
+        with transaction.atomic():
+            self.lock(restore=False)
+            infos = self.replay_history()
+            if self.archived:
+                self._freeze(
+                    {
+                        "step_id": step_id,
+                        "startedAt": info.startedAt,
+                        "startedBy_id": info.startedBy and info.startedBy.pk,
+                        "doneAt": info.doneAt,
+                        "doneBy_id": info.doneBy and info.doneBy.pk,
+                    }
+                    for step_id, info in infos.items()
+                )
+                self.__dict__.pop("step_infos", None)
+                return
+
+            self.step_states.all().delete()
+            StepState.objects.bulk_create(
+                StepState(
+                    execution=self,
+                    step_id=step_id,
+                    startedAt=info.startedAt,
+                    startedBy=info.startedBy,
+                    doneAt=info.doneAt,
+                    doneBy=info.doneBy,
+                )
+                for step_id, info in infos.items()
+            )
+
+            self.__dict__.pop("step_infos", None)
+            self.update_state()
+
+
+def last_history_id():
+    """Annotation of the id of the latest history item of an execution, or None"""
+    return Coalesce(Max("history__id"), Max("archived_history__id"))
 
 
 class HistoryItem(models.Model):
@@ -106,3 +676,145 @@ class HistoryItem(models.Model):
     step = models.ForeignKey(Step, on_delete=models.CASCADE)
     at = models.DateTimeField(auto_now_add=True)
     by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            # serves the history delta of an execution, see ExecutionViewSet.history
+            models.Index(fields=["execution", "id"], name="history_execution_cursor"),
+            # serves the items of a type for a step, see Step.history
+            models.Index(
+                fields=["step", "execution", "type", "-at"], name="history_step_lookup"
+            ),
+        ]
+
+
+class ArchivedHistoryItem(models.Model):
+    """
+    History item of an archived execution, see Execution.archive.
+    Keeps the id of the original item, so history cursors remain valid.
+    """
+
+    # shared with HistoryItem, see Execution._move_history
+    COLUMNS = ("id", "execution_id", "type", "step_id", "at", "by_id")
+
+    id = models.BigIntegerField(primary_key=True)
+    execution = models.ForeignKey(
+        Execution, on_delete=models.CASCADE, related_name="archived_history"
+    )
+
+    type = models.CharField(max_length=16, choices=HistoryItem.Type.choices)
+    step = models.ForeignKey(Step, on_delete=models.CASCADE, related_name="+")
+    at = models.DateTimeField()
+    by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["execution", "id"], name="archive_execution_cursor"),
+        ]
+
+
+class StepState(models.Model):
+    """
+    Materialized started/done info of a step within an execution.
+    Derived from the history, see Execution.record and Execution.rebuild_state.
+    """
+
+    execution = models.ForeignKey(
+        Execution, on_delete=models.CASCADE, related_name="step_states"
+    )
+    step = models.ForeignKey(Step, on_delete=models.CASCADE, related_name="states")
+
+    startedAt = models.DateTimeField(null=True, blank=True)
+    startedBy = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    doneAt = models.DateTimeField(null=True, blank=True)
+    doneBy = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+
+    STATE_FIELDS = ("startedAt", "startedBy_id", "doneAt", "doneBy_id")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["execution", "step"], name="unique_step_state"
+            )
+        ]
+
+
+class StepDurationBucket(models.Model):
+    """
+    Histogram of the time between a step being started and done, rolled up
+    across executions as they are marked, see Execution._append.
+    Bucket 0 counts durations under a second, bucket b > 0 those from
+    2^((b-1)/4) up to 2^(b/4) seconds, so each bucket spans about 19%.
+    """
+
+    BUCKETS_PER_DOUBLING = 4
+
+    step = models.ForeignKey(Step, on_delete=models.CASCADE, related_name="durations")
+    bucket = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    max_seconds = models.FloatField(
+        db_comment="Longest duration within the bucket, for an exact maximum"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["step", "bucket"], name="unique_step_duration_bucket"
+            )
+        ]
+
+    @classmethod
+    def bucket_of(cls, seconds: float) -> int:
+        if seconds < 1:
+            return 0
+        return math.floor(math.log2(seconds) * cls.BUCKETS_PER_DOUBLING) + 1
+
+    @classmethod
+    def upper_bound(cls, bucket: int) -> float:
+        return 2 ** (bucket / cls.BUCKETS_PER_DOUBLING)
+
+    @classmethod
+    def record(cls, durations: list[tuple[int, timedelta]]):
+        """
+        Count durations, given as (step_id, duration), into their buckets.
+        Uses a single INSERT ... ON CONFLICT, as supported by PostgreSQL and SQLite.
+        """
+        rows = {}
+        for step_id, duration in durations:
+            seconds = max(duration.total_seconds(), 0)
+            key = (step_id, cls.bucket_of(seconds))
+            count, max_seconds = rows.get(key, (0, 0))
+            rows[key] = (count + 1, max(max_seconds, seconds))
+        if not rows:
+            return
+
+        connection = connections[router.db_for_write(cls)]
+        quote = connection.ops.quote_name
+        table = quote(cls._meta.db_table)
+        step, bucket, count, max_seconds = (
+            quote(c) for c in ("step_id", "bucket", "count", "max_seconds")
+        )
+        greatest = "MAX" if connection.vendor == "sqlite" else "GREATEST"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({step}, {bucket}, {count}, {max_seconds}) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(rows))} "
+                f"ON CONFLICT ({step}, {bucket}) DO UPDATE SET "
+                f"{count} = {table}.{count} + EXCLUDED.{count}, "
+                f"{max_seconds} = {greatest}({table}.{max_seconds}, EXCLUDED.{max_seconds})",
+                [v for key, row in rows.items() for v in key + row],
+            )
@@ -0,0 +1,39 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ProcessCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the latest revisions, oldest process first.
+    The process id breaks ties between processes created at the same time.
+    Expects the queryset to be annotated with metaCreatedAt and metaId,
+    in the order of the meta_listing index.
+    """
+
+    ordering = ("metaCreatedAt", "metaId")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+
+class ExecutionCursorPagination(CursorPagination):
+    """
+    Keyset pagination over executions, newest first unless ?ordering=initiatedAt.
+    The execution id breaks ties between executions initiated at the same time.
+
+    There is no ordering by state: the cursor keeps the position in the first
+    field only, and skips rows sharing it by offset, which would make pages
+    deep into a state as costly as scanning it. Listings filtered by state
+    are served by the execution_state_listing index in either direction.
+    """
+
+    ordering = ("-initiatedAt", "-id")
+    orderings = {
+        "-initiatedAt": ("-initiatedAt", "-id"),
+        "initiatedAt": ("initiatedAt", "id"),
+    }
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        return self.orderings.get(request.query_params.get("ordering"), self.ordering)
@@ -0,0 +1,136 @@
+"""
+Read-only fast path for the largest response payloads.
+
+Builds the same JSON as ProcessSerializer, ExecutionSerializer,
+ExecutionStateSerializer and ExecutionShallowSerializer from values() rows
+into plain dicts, skipping the per-field overhead of the serializers.
+The serializers remain the source of truth for the API schema and for
+validating writes.
+"""
+
+from collections import defaultdict
+from typing import Iterable
+
+from django.db.models import F
+from rest_framework import serializers
+
+from .models import Execution, Process, Step, StepContent, StepState
+from .profiling import serializing
+
+# serializes like the DateTimeFields of the serializers, e.g. "...T12:00:00Z"
+serialize_datetime = serializers.DateTimeField().to_representation
+
+STEP_FIELDS = StepContent.FIELDS
+
+# for Step.objects.values(), the fields of the content of each step
+STEP_VALUES = {f: F(f"content__{f}") for f in STEP_FIELDS}
+
+
+def _process(process: Process, steps: list[dict]) -> dict:
+    meta = process.meta
+    return {
+        "revision": str(process.revision),
+        "title": process.title,
+        "createdAt": serialize_datetime(process.createdAt),
+        "meta": {
+            "id": str(meta.id),
+            "createdAt": serialize_datetime(meta.createdAt),
+            "createdBy": meta.createdBy_id,
+        },
+        "steps": steps,
+    }
+
+
+@serializing
+def process_payloads(processes: list[Process]) -> list[dict]:
+    """Payloads of the given revisions, their meta must be selected already"""
+    steps = defaultdict(list)
+    rows = Step.objects.filter(process__in=processes).values(
+        "process_id", **STEP_VALUES
+    )
+    for row in rows.order_by("process_id", "position"):
+        steps[row.pop("process_id")].append(row)
+
+    return [_process(p, steps[p.revision]) for p in processes]
+
+
+def _step_states(execution: Execution) -> dict[int, dict]:
+    """The state of the steps of an execution, keyed by step id"""
+    if execution.archived:
+        return execution.snapshot_states()
+    return {
+        row["step_id"]: row
+        for row in StepState.objects.filter(execution=execution).values(
+            "step_id", *StepState.STATE_FIELDS
+        )
+    }
+
+
+@serializing
+def execution_payload(execution: Execution) -> dict:
+    """Payload of the given execution, its process and meta must be selected already"""
+    states = _step_states(execution)
+    steps = []
+    for row in Step.objects.filter(process=execution.process_id).values(
+        "id", **STEP_VALUES
+    ):
+        state = states.get(row.pop("id"), {})
+        row["startedAt"] = serialize_datetime(state.get("startedAt"))
+        row["startedBy"] = state.get("startedBy_id")
+        row["doneAt"] = serialize_datetime(state.get("doneAt"))
+        row["doneBy"] = state.get("doneBy_id")
+        steps.append(row)
+
+    return {
+        "id": str(execution.id),
+        "initiatedAt": serialize_datetime(execution.initiatedAt),
+        "initiatedBy": execution.initiatedBy_id,
+        "state": execution.state,
+        "process": _process(execution.process, steps),
+    }
+
+
+@serializing
+def execution_state_payload(execution: Execution) -> dict:
+    """Like ExecutionStateSerializer, the state of each step without the process"""
+    states = _step_states(execution)
+    steps = []
+    for step_id, position in Step.objects.filter(
+        process=execution.process_id
+    ).values_list("id", "position"):
+        state = states.get(step_id, {})
+        steps.append(
+            {
+                "step_idx": position,
+                "startedAt": serialize_datetime(state.get("startedAt")),
+                "startedBy": state.get("startedBy_id"),
+                "doneAt": serialize_datetime(state.get("doneAt")),
+                "doneBy": state.get("doneBy_id"),
+            }
+        )
+
+    return {
+        "id": str(execution.id),
+        "initiatedAt": serialize_datetime(execution.initiatedAt),
+        "initiatedBy": execution.initiatedBy_id,
+        "state": execution.state,
+        "revision": str(execution.process_id),
+        "steps": steps,
+    }
+
+
+SHALLOW_EXECUTION_FIELDS = ("id", "initiatedAt", "initiatedBy", "state")
+
+
+@serializing
+def shallow_execution_payloads(rows: Iterable[dict]) -> list[dict]:
+    """Payloads of executions given as values(*SHALLOW_EXECUTION_FIELDS) rows"""
+    return [
+        {
+            "id": str(row["id"]),
+            "initiatedAt": serialize_datetime(row["initiatedAt"]),
+            "initiatedBy": row["initiatedBy"],
+            "state": row["state"],
+        }
+        for row in rows
+    ]
@@ -0,0 +1,92 @@
+"""
+Where the time of a request goes, see ProfilingMiddleware.
+
+The profile of the request being handled is held in a context variable,
+which follows the request into the thread running a sync view under ASGI.
+Every database connection reports its queries to it, see record_query,
+and code building response payloads its time, see serializing.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+        self.serialize = 0.0
+        self._render_start = None
+        self._serializing = False
+
+    def start_render(self):
+        self._render_start = time.perf_counter()
+
+    def end_render(self, response):
+        self.render += time.perf_counter() - self._render_start
+
+
+@contextmanager
+def profiling(profile: RequestProfile):
+    """Record the queries and serialization within the block into the profile"""
+    token = _profile.set(profile)
+    try:
+        yield
+    finally:
+        _profile.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.db += time.perf_counter() - start
+        profile.queries += 1
+
+
+@receiver(connection_created, dispatch_uid="profile_queries")
+def profile_queries(sender, connection, **kwargs):
+    # Installed on the connection rather than by the middleware: under ASGI
+    # the middleware runs in the event loop, which doesn't share the
+    # connections of the threads running the views. Connections get
+    # reopened by the same wrapper, which keeps the first one installed.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def serializing(func):
+    """
+    Count the time spent in the decorated function towards the serialize
+    time of the current request. Nested calls are counted once, and the
+    queries they make count towards the db time only.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = _profile.get()
+        if profile is None or profile._serializing:
+            return func(*args, **kwargs)
+
+        profile._serializing = True
+        start, db = time.perf_counter(), profile.db
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile._serializing = False
+            profile.serialize += time.perf_counter() - start - (profile.db - db)
+
+    return wrapper
@@ -0,0 +1,53 @@
+"""
+JSON rendering and parsing with orjson, see REST_FRAMEWORK in the settings.
+
+They produce and accept the same JSON as the renderer and parser of DRF,
+but encode and decode several times faster. Values orjson doesn't know,
+such as lazy translations or decimals, are encoded like DRF does.
+"""
+
+import orjson
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+
+# characters that are valid in JSON but not in JavaScript, escaped like DRF does
+LINE_SEPARATORS = ((b"\xe2\x80\xa8", b"\\u2028"), (b"\xe2\x80\xa9", b"\\u2029"))
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    # datetimes are formatted by the encoder of DRF, e.g. with "Z" for UTC,
+    # and keys such as the indexes in errors of a ListField become strings
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        options = self.options
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            # orjson only indents by two spaces
+            options |= orjson.OPT_INDENT_2
+
+        ret = orjson.dumps(data, default=JSONEncoder().default, option=options)
+        for char, escaped in LINE_SEPARATORS:
+            if char in ret:
+                ret = ret.replace(char, escaped)
+        return ret
+
+
+class ORJSONParser(parsers.JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        try:
+            data = stream.read()
+            if encoding.lower() not in ("utf-8", "utf8"):
+                data = data.decode(encoding)
+            return orjson.loads(data)
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
@@ -0,0 +1,195 @@
+"""
+Revisions of a process derived from the current one through step operations.
+
+The steps of the new revision are tracked as a list of segments: runs of
+unchanged steps of the current revision, and steps that were inserted or
+updated. Only the latter are loaded and get their content interned, see
+StepContent.intern, the runs are copied with a single INSERT ... SELECT.
+The cost of an edit thus depends on the number of operations, not on the
+number of steps.
+"""
+
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+from django.db import connections, router, transaction
+
+from .models import Process, Step, StepContent
+from .payloads import STEP_VALUES
+
+
+class InvalidOperation(ValueError):
+    """An operation referenced a step index out of range"""
+
+    def __init__(self, operation: int, field: str):
+        super().__init__(f"Invalid {field} in operation {operation}")
+        self.operation = operation
+        self.field = field
+
+
+@dataclass
+class Run:
+    """Unchanged steps of the current revision, at positions [start, stop)"""
+
+    start: int
+    stop: int
+
+    def __len__(self):
+        return self.stop - self.start
+
+
+@dataclass
+class Edited:
+    """A new step, or a step of the current revision with some fields changed"""
+
+    fields: dict
+    position: Optional[int] = None
+
+    def __len__(self):
+        return 1
+
+
+Segment = Union[Run, Edited]
+
+
+@dataclass
+class StepEdits:
+    length: int
+    segments: list[Segment] = field(default_factory=list)
+
+    def __post_init__(self):
+        if self.length:
+            self.segments = [Run(0, self.length)]
+
+    def _split(self, idx: int) -> int:
+        """Index of the segment starting at step idx, splitting a run if needed"""
+        offset = 0
+        for i, segment in enumerate(self.segments):
+            if offset == idx:
+                return i
+            if idx < offset + len(segment):
+                # only runs span several steps
+                at = segment.start + idx - offset
+                self.segments[i : i + 1] = [
+                    Run(segment.start, at),
+                    Run(at, segment.stop),
+                ]
+                return i + 1
+            offset += len(segment)
+        return len(self.segments)
+
+    def _take(self, idx: int) -> Segment:
+        """Remove the step at idx, returning it as a segment of its own"""
+        i = self._split(idx)
+        self._split(idx + 1)
+        self.length -= 1
+        return self.segments.pop(i)
+
+    def _put(self, idx: int, segment: Segment):
+        self.segments.insert(self._split(idx), segment)
+        self.length += 1
+
+    def apply(self, operation: int, op: dict):
+        """Apply an operation, see ProcessStepOperationSerializer"""
+        idx = op["step_idx"]
+        limit = self.length + 1 if op["op"] == "insert" else self.length
+        if idx >= limit:
+            raise InvalidOperation(operation, "step_idx")
+
+        if op["op"] == "insert":
+            self._put(idx, Edited(op["step"]))
+        elif op["op"] == "delete":
+            self._take(idx)
+        elif op["op"] == "update":
+            segment = self._take(idx)
+            if isinstance(segment, Run):
+                segment = Edited({}, position=segment.start)
+            segment.fields = {**segment.fields, **op["step"]}
+            self._put(idx, segment)
+        elif op["op"] == "move":
+            if op["to"] >= self.length:
+                raise InvalidOperation(operation, "to")
+            self._put(op["to"], self._take(idx))
+
+
+def _copy_runs(source: Process, target: Process, runs: list[tuple[Run, int]]):
+    """
+    Copy runs of steps from one revision to another with a single
+    INSERT ... SELECT, given each run with its position in the target
+    """
+    connection = connections[router.db_for_write(Step)]
+    quote = connection.ops.quote_name
+    table = quote(Step._meta.db_table)
+    process, position = quote("process_id"), quote("position")
+    columns = [quote(f.column) for f in Step._meta.concrete_fields if not f.primary_key]
+
+    in_run = f"({position} >= %s AND {position} < %s)"
+    shifts = " ".join(f"WHEN {in_run} THEN {position} + %s" for _ in runs)
+    selected = {process: "%s", position: f"CASE {shifts} END"}
+
+    params = [Process._meta.pk.get_db_prep_value(target.pk, connection)]
+    for run, to in runs:
+        params += [run.start, run.stop, to - run.start]
+    params.append(Process._meta.pk.get_db_prep_value(source.pk, connection))
+    for run, _ in runs:
+        params += [run.start, run.stop]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"SELECT {', '.join(selected.get(c, c) for c in columns)} FROM {table} "
+            f"WHERE {process} = %s AND ({' OR '.join(in_run for _ in runs)})",
+            params,
+        )
+
+
+def derive_revision(
+    current: Process, operations: list[dict], title: Optional[str] = None
+) -> Process:
+    """
+    Create a new revision of a process from its current revision and the
+    given step operations, applied in order. Raises InvalidOperation, before
+    writing anything, if an operation references a step that doesn't exist.
+    The caller is expected to hold a lock on the meta of the process.
+    """
+    edits = StepEdits(Step.objects.filter(process=current).count())
+    for i, op in enumerate(operations):
+        edits.apply(i, op)
+
+    updated = [
+        s for s in edits.segments if isinstance(s, Edited) and s.position is not None
+    ]
+    originals = {}
+    if updated:
+        originals = {
+            row.pop("position"): row
+            for row in Step.objects.filter(
+                process=current, position__in=[s.position for s in updated]
+            ).values("position", **STEP_VALUES)
+        }
+
+    with transaction.atomic():
+        process = Process.objects.create(
+            meta=current.meta, title=current.title if title is None else title
+        )
+
+        runs, positions, contents = [], [], []
+        position = 0
+        for segment in edits.segments:
+            if isinstance(segment, Run):
+                runs.append((segment, position))
+            else:
+                positions.append(position)
+                contents.append(
+                    {**originals.get(segment.position, {}), **segment.fields}
+                )
+            position += len(segment)
+
+        if runs:
+            _copy_runs(current, process, runs)
+        Step.objects.bulk_create(
+            Step(process=process, position=position, content_id=content_id)
+            for position, content_id in zip(positions, StepContent.intern(contents))
+        )
+
+    return process
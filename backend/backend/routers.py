@@ -0,0 +1,123 @@
+"""
+Routing of reads to a replica database, see REPLICA_DATABASE in the settings.
+
+Reads go to the replica while handling a request without side effects,
+see ReplicaMiddleware. Everything else, including every write, goes to the
+default database. After a client wrote something, its reads stay on the
+default database for a while, so it doesn't miss its own writes while the
+replica catches up. Clients are recognized by a cookie, and authenticated
+users also by their id, for clients that don't keep cookies, e.g. scripts
+using Basic authentication.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+_read_replica = ContextVar("read_replica", default=False)
+
+# marks a client that wrote recently, see REPLICA_STICKINESS
+STICKY_COOKIE = "prapp_primary"
+
+
+def _writer_key(user_id) -> str:
+    return f"replica-writer:{user_id}"
+
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+@contextmanager
+def reading_replica():
+    """Route the reads within the block to the replica, if there is one"""
+    token = _read_replica.set(True)
+    try:
+        yield
+    finally:
+        _read_replica.reset(token)
+
+
+def authenticated(user):
+    """
+    Route the remaining reads of the request to the default database if the
+    user wrote recently. Called by the authentication classes, as users are
+    only known once the view authenticates the request.
+    """
+    if _read_replica.get() and cache.get(_writer_key(user.pk)):
+        _read_replica.set(False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _read_replica.get() and settings.REPLICA_DATABASE:
+            return settings.REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        # also for instances that were read from the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica gets its schema through replication
+        return False if db == settings.REPLICA_DATABASE else None
+
+
+class ReplicaMiddleware:
+    """
+    Serves safe requests from the replica, unless the client wrote recently.
+    Responses to other requests mark the client with a cookie for that.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if self.reads_replica(request):
+            with reading_replica():
+                return self.get_response(request)
+        return self.mark_writer(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        if self.reads_replica(request):
+            # the context, and so the routing, follows into sync views
+            with reading_replica():
+                return await self.get_response(request)
+        return self.mark_writer(request, await self.get_response(request))
+
+    def reads_replica(self, request) -> bool:
+        return (
+            bool(settings.REPLICA_DATABASE)
+            and request.method in SAFE_METHODS
+            and STICKY_COOKIE not in request.COOKIES
+        )
+
+    def mark_writer(self, request, response):
+        if settings.REPLICA_DATABASE and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                STICKY_COOKIE,
+                "1",
+                max_age=settings.REPLICA_STICKINESS,
+                httponly=True,
+                samesite="Lax",
+            )
+            # set by the view once authenticated, see authenticated()
+            user = getattr(request, "user", None)
+            if user is not None and user.is_authenticated:
+                cache.set(_writer_key(user.pk), True, settings.REPLICA_STICKINESS)
+        return response
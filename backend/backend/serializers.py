@@ -1,9 +1,23 @@
 from typing import Literal, Optional
+from django.db import transaction
 from rest_framework import serializers
-from .models import Execution, Meta, Process, Step
+from .models import Execution, HistoryItem, Meta, Process, Step, StepContent
+from . import fieldsets
+from .pagination import ExecutionCursorPagination
+from .profiling import serializing
 from datetime import datetime
 
 
+class ProfiledSerializerMixin:
+    # For the serializers of response bodies: their output counts towards the
+    # serialize time of the request, see ProfilingMiddleware. Nested
+    # serializers are counted within the outermost one.
+
+    @serializing
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
+
 class EmptySerializer(serializers.Serializer):
     pass
 
@@ -20,7 +34,7 @@ class MetaSerializer(serializers.ModelSerializer):
 
 class StepSerializer(serializers.ModelSerializer):
     class Meta:
-        model = Step
+        model = StepContent
         fields = (
             "title",
             "type",
@@ -29,7 +43,7 @@ class StepSerializer(serializers.ModelSerializer):
         )
 
 
-class ProcessSerializer(serializers.ModelSerializer):
+class ProcessSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     steps = StepSerializer(many=True)
     meta = MetaSerializer(required=False, read_only=True)
 
@@ -38,6 +52,7 @@ class ProcessSerializer(serializers.ModelSerializer):
         fields = ("revision", "title", "createdAt", "meta", "steps")
         depth = 1
 
+    @transaction.atomic
     def create(self, validated_data):
         steps = validated_data.pop("steps")
 
@@ -47,11 +62,46 @@ class ProcessSerializer(serializers.ModelSerializer):
             meta = self.context["meta"]
 
         process = Process.objects.create(meta=meta, **validated_data)
-        for step in steps:
-            Step.objects.create(process=process, **step)
+        Step.objects.bulk_create(
+            Step(process=process, position=position, content_id=content_id)
+            for position, content_id in enumerate(StepContent.intern(steps))
+        )
         return process
 
 
+class ProcessStepOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(["insert", "update", "delete", "move"])
+    step_idx = serializers.IntegerField(
+        min_value=0, help_text="Index in the steps as left by the previous operations"
+    )
+    to = serializers.IntegerField(
+        min_value=0, required=False, help_text="New index of the step, for move"
+    )
+    step = serializers.DictField(
+        required=False,
+        help_text="The step for insert, only the fields that change for update",
+    )
+
+    def validate(self, attrs):
+        if attrs["op"] in ("insert", "update") and "step" not in attrs:
+            raise serializers.ValidationError({"step": "This field is required."})
+        if attrs["op"] == "move" and "to" not in attrs:
+            raise serializers.ValidationError({"to": "This field is required."})
+
+        if "step" in attrs:
+            step = StepSerializer(data=attrs["step"], partial=attrs["op"] == "update")
+            if not step.is_valid():
+                raise serializers.ValidationError({"step": step.errors})
+            attrs["step"] = step.validated_data
+        return attrs
+
+
+class ProcessPatchSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=200, required=False)
+    operations = ProcessStepOperationSerializer(many=True, required=False)
+
+
+# serializes Step instances, which expose the fields of their content
 class StepExecutionSerializer(serializers.ModelSerializer):
     startedAt = serializers.SerializerMethodField()
     startedBy = serializers.SerializerMethodField()
@@ -59,7 +109,7 @@ class StepExecutionSerializer(serializers.ModelSerializer):
     doneBy = serializers.SerializerMethodField()
 
     class Meta:
-        model = Step
+        model = StepContent
         fields = (
             "title",
             "type",
@@ -71,25 +121,29 @@ class StepExecutionSerializer(serializers.ModelSerializer):
             "doneBy",
         )
 
+    def _info(self, obj: Step) -> Step.ExecutionInfo:
+        return obj.execution_info(self.context["execution"])
+
     def get_startedAt(self, obj: Step) -> Optional[datetime]:
-        self.info = obj.execution_info(self.context["execution"])
-        return self.info.startedAt
+        return self._info(obj).startedAt
 
-    def get_startedBy(self, obj) -> Optional[int]:
-        return self.info.startedBy.pk if self.info.startedBy else None
+    def get_startedBy(self, obj: Step) -> Optional[int]:
+        info = self._info(obj)
+        return info.startedBy.pk if info.startedBy else None
 
-    def get_doneAt(self, obj) -> Optional[datetime]:
-        return self.info.doneAt
+    def get_doneAt(self, obj: Step) -> Optional[datetime]:
+        return self._info(obj).doneAt
 
-    def get_doneBy(self, obj) -> Optional[int]:
-        return self.info.doneBy.pk if self.info.doneBy else None
+    def get_doneBy(self, obj: Step) -> Optional[int]:
+        info = self._info(obj)
+        return info.doneBy.pk if info.doneBy else None
 
 
 class ProcessExecutionSerializer(ProcessSerializer):
     steps = StepExecutionSerializer(many=True)
 
 
-class ExecutionSerializer(serializers.ModelSerializer):
+class ExecutionSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     process = ProcessExecutionSerializer()
     state = serializers.SerializerMethodField()
 
@@ -106,7 +160,7 @@ class ExecutionSerializer(serializers.ModelSerializer):
         return obj.state
 
 
-class ExecutionShallowSerializer(serializers.ModelSerializer):
+class ExecutionShallowSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     state = serializers.SerializerMethodField()
 
     class Meta:
@@ -117,6 +171,143 @@ class ExecutionShallowSerializer(serializers.ModelSerializer):
         return obj.state
 
 
+class ExecutionListQuerySerializer(serializers.Serializer):
+    state = serializers.ChoiceField(
+        Execution.ExecutionState.choices,
+        required=False,
+        help_text="Only executions in this state. To list by state, "
+        "request each state in turn",
+    )
+    ordering = serializers.ChoiceField(
+        list(ExecutionCursorPagination.orderings),
+        required=False,
+        help_text="Newest first by default, initiatedAt for oldest first. "
+        "There is no ordering by state, filter by state instead",
+    )
+
+
+class ProcessStartExecutionsSerializer(serializers.Serializer):
+    count = serializers.IntegerField(min_value=1, max_value=200)
+
+
 class ExecutionMarkStepSerializer(serializers.Serializer):
     mark_as = serializers.ChoiceField(["StepStarted", "StepDone"])
     step_idx = serializers.IntegerField()
+
+
+class ExecutionMarkStepsSerializer(serializers.Serializer):
+    operations = ExecutionMarkStepSerializer(many=True, allow_empty=False)
+
+
+class StepStateSerializer(StepExecutionSerializer):
+    step_idx = serializers.IntegerField(source="position")
+
+    class Meta:
+        model = Step
+        fields = ("step_idx", "startedAt", "startedBy", "doneAt", "doneBy")
+
+
+class ExecutionStateSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    """
+    An execution with the state of its steps, but not its process.
+    Revisions never change, so clients fetch one once and match its steps by step_idx.
+    """
+
+    revision = serializers.UUIDField(source="process_id")
+    state = serializers.SerializerMethodField()
+    steps = StepStateSerializer(many=True, source="process.steps")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance:
+            self.context["execution"] = self.instance
+
+    class Meta:
+        model = Execution
+        fields = ("id", "initiatedAt", "initiatedBy", "state", "revision", "steps")
+
+    def get_state(self, obj: Execution) -> Literal["done", "started"]:
+        return obj.state
+
+
+class ExecutionDeltaSerializer(ProfiledSerializerMixin, serializers.Serializer):
+    state = serializers.ChoiceField(Execution.ExecutionState.choices)
+    steps = StepStateSerializer(many=True)
+
+
+class HistoryItemSerializer(serializers.ModelSerializer):
+    step_idx = serializers.IntegerField(source="step.position", read_only=True)
+
+    class Meta:
+        model = HistoryItem
+        fields = ("id", "type", "step_idx", "at", "by")
+
+
+class ExecutionHistoryQuerySerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+
+
+class ExecutionHistorySerializer(ProfiledSerializerMixin, serializers.Serializer):
+    items = HistoryItemSerializer(many=True)
+    cursor = serializers.IntegerField(
+        help_text="Pass as since to receive the items created afterwards"
+    )
+
+
+class ProcessExportQuerySerializer(serializers.Serializer):
+    output = serializers.ChoiceField(["ndjson", "csv"], default="ndjson")
+
+
+class StepDurationSerializer(ProfiledSerializerMixin, serializers.Serializer):
+    step_idx = serializers.IntegerField()
+    title = serializers.CharField()
+    count = serializers.IntegerField(help_text="Number of times the step was done")
+    p50 = serializers.FloatField(allow_null=True, help_text="Median, in seconds")
+    p95 = serializers.FloatField(allow_null=True)
+    max = serializers.FloatField(allow_null=True)
+
+
+class SparseFieldsetQuerySerializer(serializers.Serializer):
+    """Validates ?fields= and ?omit= against the fields of the response"""
+
+    response: type[serializers.Serializer]
+
+    fields = serializers.CharField(
+        required=False,
+        help_text="Comma separated fields to include, with dots for nested fields",
+    )
+    omit = serializers.CharField(
+        required=False,
+        help_text="Comma separated fields to leave out, with dots for nested fields",
+    )
+
+    def response_serializer(self, attrs) -> serializers.Serializer:
+        return self.response()
+
+    def validate(self, attrs):
+        known = fieldsets.fields_of(self.response_serializer(attrs))
+        for name in ("fields", "omit"):
+            if name in attrs:
+                attrs[name] = fieldsets.parse(attrs[name])
+                if unknown := fieldsets.unknown(attrs[name], known):
+                    raise serializers.ValidationError(
+                        {name: f"Unknown fields: {', '.join(unknown)}"}
+                    )
+        return attrs
+
+
+class ProcessQuerySerializer(SparseFieldsetQuerySerializer):
+    response = ProcessSerializer
+
+
+class ExecutionQuerySerializer(SparseFieldsetQuerySerializer):
+    view = serializers.ChoiceField(
+        ["full", "state"],
+        default="full",
+        help_text="state leaves out the process, see ExecutionState",
+    )
+
+    def response_serializer(self, attrs) -> serializers.Serializer:
+        if attrs["view"] == "state":
+            return ExecutionStateSerializer()
+        return ExecutionSerializer()
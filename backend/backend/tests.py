@@ -1,3 +1,1659 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import json
+import re
+import time
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from datetime import timedelta
+
+import brotli
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connection, connections, router, transaction
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import benchmark, export, payloads
+from .admin import EstimatedCountPaginator
+from .broadcast import Broadcaster, get_broadcaster
+from .middleware import CompressionMiddleware
+from .models import (
+    ArchivedHistoryItem,
+    Execution,
+    HistoryItem,
+    Meta,
+    Process,
+    Step,
+    StepContent,
+    StepDurationBucket,
+    StepState,
+    last_history_id,
+)
+from .profiling import RequestProfile, profiling, serializing
+from .renderers import ORJSONParser, ORJSONRenderer
+from .routers import STICKY_COOKIE, ReplicaMiddleware
+from .serializers import (
+    ExecutionSerializer,
+    ExecutionShallowSerializer,
+    ExecutionStateSerializer,
+    ProcessSerializer,
+)
+
+
+def make_process_payload(n_steps: int, title: str = "Checklist"):
+    steps = [{"title": "Section", "type": "SE"}]
+    steps += [
+        {"title": f"Step {i}", "type": "ST", "startWithPrevious": i == 0}
+        for i in range(n_steps)
+    ]
+    return {"title": title, "steps": steps}
+
+
+@async_to_sync
+async def streamed(response) -> bytes:
+    """The whole body of a response streamed from an async iterator"""
+    return b"".join([chunk async for chunk in response.streaming_content])
+
+
+class ApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="secret")
+        self.client.force_authenticate(self.user)
+
+    def create_process(self, n_steps: int = 3, **kwargs):
+        res = self.client.post(
+            "/api/processes/", make_process_payload(n_steps, **kwargs), format="json"
+        )
+        self.assertEqual(res.status_code, 201)
+        return res.data
+
+    def start_execution(self, meta_id):
+        res = self.client.post(f"/api/processes/{meta_id}/start_execution/")
+        self.assertEqual(res.status_code, 200)
+        return res.data
+
+    def mark_step(self, execution_id, step_idx, mark_as):
+        return self.client.post(
+            f"/api/executions/{execution_id}/mark_step/",
+            {"step_idx": step_idx, "mark_as": mark_as},
+            format="json",
+        )
+
+
+class ExecutionStateTests(ApiTestCase):
+    def run_execution(self, n_steps):
+        process = self.create_process(n_steps)
+        execution = self.start_execution(process["meta"]["id"])
+        for idx in range(1, n_steps + 1):
+            self.mark_step(execution["id"], idx, "StepStarted")
+            self.mark_step(execution["id"], idx, "StepDone")
+        return execution["id"]
+
+    def count_retrieve_queries(self, execution_id):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(f"/api/executions/{execution_id}/")
+        self.assertEqual(res.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_retrieve_query_count_independent_of_steps(self):
+        small = self.count_retrieve_queries(self.run_execution(2))
+        large = self.count_retrieve_queries(self.run_execution(40))
+        self.assertEqual(small, large)
+
+    def test_state_follows_latest_history(self):
+        process = self.create_process(2)
+        execution = self.start_execution(process["meta"]["id"])
+        self.assertEqual(execution["state"], "started")
+        self.assertIsNotNone(execution["process"]["steps"][1]["startedAt"])
+        self.assertEqual(execution["process"]["steps"][1]["startedBy"], self.user.pk)
+
+        self.mark_step(execution["id"], 1, "StepDone")
+        self.mark_step(execution["id"], 2, "StepStarted")
+        res = self.mark_step(execution["id"], 2, "StepDone")
+        self.assertEqual(res.data["state"], "done")
+        self.assertEqual(res.data["process"]["steps"][2]["doneBy"], self.user.pk)
+        self.assertEqual(Execution.objects.get(pk=execution["id"]).state, "done")
+
+    def test_mark_step_rejects_sections(self):
+        process = self.create_process(1)
+        execution = self.start_execution(process["meta"]["id"])
+        res = self.mark_step(execution["id"], 0, "StepDone")
+        self.assertEqual(res.status_code, 400)
+
+    def test_rebuild_state_matches_recorded_state(self):
+        process = self.create_process(2)
+        execution = self.start_execution(process["meta"]["id"])
+        for idx in (1, 2):
+            self.mark_step(execution["id"], idx, "StepStarted")
+            self.mark_step(execution["id"], idx, "StepDone")
+        before = self.client.get(f"/api/executions/{execution['id']}/").data
+
+        StepState.objects.all().delete()
+        Execution.objects.update(state=Execution.ExecutionState.Started)
+        call_command("rebuild_execution_state", stdout=StringIO())
+
+        after = self.client.get(f"/api/executions/{execution['id']}/").data
+        self.assertEqual(after["state"], "done")
+        self.assertEqual(before, after)
+
+    def test_meta_follows_process(self):
+        execution = Execution.objects.get(
+            pk=self.start_execution(self.create_process(1)["meta"]["id"])["id"]
+        )
+        other = Process.objects.get(revision=self.create_process(1)["revision"])
+
+        original = execution.process
+        for process, update_fields in ((other, None), (original, ["process"])):
+            execution.process = process
+            execution.save(update_fields=update_fields)
+            execution.refresh_from_db()
+            self.assertEqual(execution.meta_id, process.meta_id)
+
+    def test_executions_listing_query_count_independent_of_count(self):
+        process = self.create_process(5)
+        meta_id = process["meta"]["id"]
+
+        def count():
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(f"/api/processes/{meta_id}/executions/")
+            return len(ctx.captured_queries)
+
+        self.start_execution(meta_id)
+        single = count()
+        for _ in range(10):
+            self.start_execution(meta_id)
+        self.assertEqual(single, count())
+
+
+class ProcessTests(ApiTestCase):
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get("/api/processes/")
+        self.assertEqual(res.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_update_creates_current_revision(self):
+        process = self.create_process(2, title="First")
+        meta_id = process["meta"]["id"]
+        res = self.client.put(
+            f"/api/processes/{meta_id}/",
+            make_process_payload(3, title="Second"),
+            format="json",
+        )
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client.get(f"/api/processes/{meta_id}/")
+        self.assertEqual(res.data["title"], "Second")
+        self.assertEqual(len(res.data["steps"]), 4)
+        self.assertEqual(
+            [p["title"] for p in self.client.get("/api/processes/").data["results"]],
+            ["Second"],
+        )
+
+    def test_list_query_count_independent_of_processes(self):
+        self.create_process(2)
+        single = self.count_list_queries()
+        for i in range(5):
+            process = self.create_process(3)
+            self.client.put(
+                f"/api/processes/{process['meta']['id']}/",
+                make_process_payload(4),
+                format="json",
+            )
+        self.assertEqual(single, self.count_list_queries())
+
+    def test_create_inserts_steps_in_bulk(self):
+        with CaptureQueriesContext(connection) as ctx:
+            process = self.create_process(150)
+        self.assertLess(len(ctx.captured_queries), 15)
+
+        res = self.client.get(f"/api/processes/{process['meta']['id']}/")
+        titles = [s["title"] for s in res.data["steps"]]
+        self.assertEqual(titles, ["Section"] + [f"Step {i}" for i in range(150)])
+
+
+class PaginationTests(ApiTestCase):
+    def collect_pages(self, url):
+        items, pages = [], 0
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, 200)
+            items += res.data["results"]
+            url, pages = res.data["next"], pages + 1
+        return items, pages
+
+    def test_executions_are_paginated_newest_first(self):
+        process = self.create_process(1)
+        meta_id = process["meta"]["id"]
+        started = [self.start_execution(meta_id)["id"] for _ in range(7)]
+
+        items, pages = self.collect_pages(
+            f"/api/processes/{meta_id}/executions/?page_size=3"
+        )
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(e["id"] for e in items), sorted(started))
+        initiated = [e["initiatedAt"] for e in items]
+        self.assertEqual(initiated, sorted(initiated, reverse=True))
+
+    def test_processes_are_paginated_with_ties(self):
+        created = [self.create_process(1, title=str(i)) for i in range(5)]
+        # identical creation times must still page through every process once
+        Meta.objects.update(createdAt=timezone.now())
+
+        items, pages = self.collect_pages("/api/processes/?page_size=2")
+        self.assertEqual(pages, 3)
+        self.assertEqual(
+            sorted(p["revision"] for p in items),
+            sorted(p["revision"] for p in created),
+        )
+
+
+class ConditionalRequestTests(ApiTestCase):
+    def test_process_retrieve_not_modified(self):
+        process = self.create_process(3)
+        url = f"/api/processes/{process['meta']['id']}/"
+        res = self.client.get(url)
+        self.assertEqual(res["ETag"], f'"{process["revision"]}"')
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=res["ETag"])
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        self.client.put(url, make_process_payload(4), format="json")
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=res["ETag"]).status_code, 200
+        )
+
+    def test_cached_revisions_skip_steps(self):
+        process = self.create_process(3)
+        url = f"/api/processes/{process['meta']['id']}/"
+        first = self.client.get(url)
+
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(url)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_process_list_not_modified(self):
+        process = self.create_process(1)
+        etag = self.client.get("/api/processes/")["ETag"]
+        self.assertEqual(
+            self.client.get("/api/processes/", HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+
+        self.client.put(
+            f"/api/processes/{process['meta']['id']}/",
+            make_process_payload(2),
+            format="json",
+        )
+        self.assertEqual(
+            self.client.get("/api/processes/", HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def test_process_list_etag_follows_links(self):
+        for _ in range(2):
+            self.create_process(1)
+        res = self.client.get("/api/processes/?page_size=2")
+        self.assertIsNone(res.data["next"])
+
+        self.create_process(1)
+        res = self.client.get(
+            "/api/processes/?page_size=2", HTTP_IF_NONE_MATCH=res["ETag"]
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNotNone(res.data["next"])
+
+    def test_execution_etag_follows_history(self):
+        process = self.create_process(2)
+        execution = self.start_execution(process["meta"]["id"])
+        url = f"/api/executions/{execution['id']}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.mark_step(execution["id"], 1, "StepDone")
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res["ETag"], etag)
+
+
+class RecordingBroadcaster(Broadcaster):
+    """Stand-in for a broadcaster, remembering what got published"""
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+class LiveUpdateTests(ApiTestCase):
+    @override_settings(EXECUTION_BROADCASTER="backend.tests.RecordingBroadcaster")
+    def test_history_items_are_published_on_commit(self):
+        broadcaster = get_broadcaster()
+        process = self.create_process(2)
+        execution = self.start_execution(process["meta"]["id"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mark_step(execution["id"], 1, "StepDone")
+
+        channels = [channel for channel, _ in broadcaster.published]
+        self.assertEqual(channels, [execution["id"]])
+        message = broadcaster.published[0][1]
+        self.assertEqual(message["type"], "StepDone")
+        self.assertEqual(message["step_idx"], 1)
+        self.assertEqual(message["by"], self.user.pk)
+
+    async def test_event_stream_pushes_published_items(self):
+        process = await sync_to_async(self.create_process)(1)
+        execution = await sync_to_async(self.start_execution)(process["meta"]["id"])
+
+        await self.async_client.aforce_login(self.user)
+        res = await self.async_client.get(f"/api/executions/{execution['id']}/events/")
+        self.assertEqual(res["Content-Type"], "text/event-stream")
+
+        stream = aiter(res.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b"retry:"))
+
+        get_broadcaster().publish(execution["id"], {"id": 42, "type": "StepDone"})
+        event = (await anext(stream)).decode()
+        self.assertIn("id: 42\n", event)
+        self.assertIn("event: history\n", event)
+        data = event.split("data: ")[1].strip()
+        self.assertEqual(json.loads(data), {"id": 42, "type": "StepDone"})
+        await stream.aclose()
+
+    def test_event_stream_requires_authentication(self):
+        process = self.create_process(1)
+        execution = self.start_execution(process["meta"]["id"])
+        self.client.logout()
+        self.client.force_authenticate(None)
+
+        res = self.client.get(f"/api/executions/{execution['id']}/events/")
+        self.assertEqual(res.status_code, 401)
+
+    async def test_event_stream_replays_missed_items(self):
+        process = await sync_to_async(self.create_process)(2)
+        execution = await sync_to_async(self.start_execution)(process["meta"]["id"])
+        await sync_to_async(self.mark_step)(execution["id"], 1, "StepDone")
+
+        await self.async_client.aforce_login(self.user)
+        res = await self.async_client.get(
+            f"/api/executions/{execution['id']}/events/", headers={"Last-Event-ID": "0"}
+        )
+        stream = aiter(res.streaming_content)
+        await anext(stream)
+        replayed = [(await anext(stream)).decode() for _ in range(2)]
+        self.assertIn("StepStarted", replayed[0])
+        self.assertIn("StepDone", replayed[1])
+        await stream.aclose()
+
+
+class HistoryDeltaTests(ApiTestCase):
+    def test_history_since_cursor(self):
+        process = self.create_process(2)
+        execution = self.start_execution(process["meta"]["id"])
+        url = f"/api/executions/{execution['id']}/history/"
+
+        res = self.client.get(url)
+        self.assertEqual([i["type"] for i in res.data["items"]], ["StepStarted"])
+        cursor = res.data["cursor"]
+
+        self.mark_step(execution["id"], 1, "StepDone")
+        res = self.client.get(url, {"since": cursor})
+        self.assertEqual(
+            [(i["type"], i["step_idx"]) for i in res.data["items"]],
+            [("StepDone", 1)],
+        )
+        self.assertGreater(res.data["cursor"], cursor)
+        cursor = res.data["cursor"]
+
+        res = self.client.get(url, {"since": cursor})
+        self.assertEqual(res.data["items"], [])
+        self.assertEqual(res.data["cursor"], cursor)
+
+    def test_history_rejects_invalid_cursor(self):
+        process = self.create_process(1)
+        execution = self.start_execution(process["meta"]["id"])
+        res = self.client.get(
+            f"/api/executions/{execution['id']}/history/", {"since": "abc"}
+        )
+        self.assertEqual(res.status_code, 400)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN on the hot queries against a seeded database and fails
+    if any of them falls back to a sequential scan or a sort.
+    """
+
+    # patterns in the query plan, by database vendor
+    FORBIDDEN_PLANS = {
+        "sqlite": [r"\bSCAN (?!.*\bUSING (COVERING )?INDEX\b)", r"USE TEMP B-TREE"],
+        "postgresql": [r"\bSeq Scan\b", r"\bSort\b"],
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [User.objects.create_user(f"user{i}") for i in range(20)]
+        for m in range(5):
+            meta = Meta.objects.create(createdBy=users[m])
+            process = Process.objects.create(meta=meta, title=f"Process {m}")
+            contents = StepContent.intern(
+                [{"title": f"Step {i}", "type": "ST"} for i in range(20)]
+            )
+            Step.objects.bulk_create(
+                Step(process=process, position=i, content_id=content_id)
+                for i, content_id in enumerate(contents)
+            )
+            for e in range(10):
+                execution = Execution.objects.create(
+                    process=process, initiatedBy=users[e]
+                )
+                for step in process.steps.all()[:10]:
+                    execution.record("StepStarted", step, users[e])
+                    execution.record("StepDone", step, users[e + 1])
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        cls.execution = Execution.objects.select_related("process").first()
+        cls.step = cls.execution.process.steps.first()
+
+    def assertUsesIndexes(self, queryset):
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # small tables are cheaper to scan, only fall back if there is no index
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+                    cursor.execute("SET LOCAL enable_sort = off")
+            plan = queryset.explain()
+
+        for pattern in self.FORBIDDEN_PLANS.get(connection.vendor, []):
+            self.assertIsNone(re.search(pattern, plan), f"Query plan:\n{plan}")
+
+    def test_history_delta(self):
+        self.assertUsesIndexes(
+            HistoryItem.objects.filter(execution=self.execution, id__gt=0)
+            .select_related("step")
+            .order_by("id")
+        )
+
+    def test_step_history_by_type(self):
+        self.assertUsesIndexes(self.step.history(self.execution, "StepDone"))
+
+    def test_executions_of_process(self):
+        meta_id = self.execution.process.meta_id
+        self.assertUsesIndexes(
+            Execution.objects.filter(meta=meta_id).order_by("-initiatedAt", "-id")[:51]
+        )
+
+    def test_executions_of_process_in_state(self):
+        meta_id = self.execution.process.meta_id
+        self.assertUsesIndexes(
+            Execution.objects.filter(meta=meta_id, state="started").order_by(
+                "initiatedAt", "id"
+            )[:51]
+        )
+
+    def test_steps_of_revision(self):
+        self.assertUsesIndexes(self.execution.process.steps.all())
+
+    def test_step_states_of_execution(self):
+        self.assertUsesIndexes(
+            self.execution.step_states.select_related("startedBy", "doneBy")
+        )
+
+    def test_execution_etag(self):
+        self.assertUsesIndexes(
+            Execution.objects.filter(pk=self.execution.pk)
+            .annotate(last_history=last_history_id())
+            .values("id", "last_history")
+        )
+
+    def test_process_list(self):
+        self.assertUsesIndexes(
+            Process.objects.filter(current_of__isnull=False)
+            .annotate(
+                metaCreatedAt=F("current_of__createdAt"), metaId=F("current_of__id")
+            )
+            .order_by("metaCreatedAt", "metaId")[:51]
+        )
+
+    def test_current_revision(self):
+        self.assertUsesIndexes(
+            Process.objects.select_related("meta").filter(
+                current_of=self.execution.process.meta_id
+            )
+        )
+
+
+class ScalingTests(TestCase):
+    """Query count of every endpoint must not grow with the size of the data"""
+
+    base = benchmark.Dataset(templates=2, revisions=2, steps=3, executions=2, history=2)
+
+    def assertFlat(self, parameter, values):
+        result = benchmark.sweep(self.base, parameter, values, repeat=1)
+        for run in result["runs"]:
+            for name, measurement in run["endpoints"].items():
+                self.assertLess(measurement["status"], 300, name)
+        growing = {
+            n: r["queries"] for n, r in result["scaling"].items() if not r["flat"]
+        }
+        self.assertEqual(growing, {})
+
+    def test_steps(self):
+        self.assertFlat("steps", [3, 30])
+
+    def test_executions_and_history(self):
+        self.assertFlat("executions", [1, 8])
+        self.assertFlat("history", [1, 3])
+
+
+class MarkStepsTests(ApiTestCase):
+    def mark_steps(self, execution_id, operations):
+        return self.client.post(
+            f"/api/executions/{execution_id}/mark_steps/",
+            {"operations": [{"step_idx": i, "mark_as": m} for i, m in operations]},
+            format="json",
+        )
+
+    def test_batch_applies_operations_in_order(self):
+        # startWithPrevious is only set on the first step
+        process = self.create_process(3)
+        execution = self.start_execution(process["meta"]["id"])
+
+        res = self.mark_steps(
+            execution["id"],
+            [(1, "StepDone"), (2, "StepStarted"), (2, "StepDone")],
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["state"], "started")
+        self.assertEqual([s["step_idx"] for s in res.data["steps"]], [1, 2])
+        self.assertIsNotNone(res.data["steps"][1]["doneAt"])
+
+        res = self.mark_steps(execution["id"], [(3, "StepStarted"), (3, "StepDone")])
+        self.assertEqual(res.data["state"], "done")
+        self.assertEqual([s["step_idx"] for s in res.data["steps"]], [3])
+
+    def test_batch_chains_start_with_previous(self):
+        process = self.create_process(0)
+        meta_id = process["meta"]["id"]
+        steps = [
+            {"title": "A", "type": "ST"},
+            {"title": "B", "type": "ST", "startWithPrevious": True},
+        ]
+        self.client.put(
+            f"/api/processes/{meta_id}/", {"title": "T", "steps": steps}, format="json"
+        )
+        execution = self.start_execution(meta_id)
+
+        res = self.mark_steps(execution["id"], [(0, "StepStarted"), (0, "StepDone")])
+        self.assertEqual([s["step_idx"] for s in res.data["steps"]], [0, 1])
+        self.assertIsNotNone(res.data["steps"][1]["startedAt"])
+        self.assertIsNone(res.data["steps"][1]["doneAt"])
+
+    def test_batch_is_atomic(self):
+        process = self.create_process(2)
+        execution = self.start_execution(process["meta"]["id"])
+        history = self.client.get(f"/api/executions/{execution['id']}/history/")
+
+        res = self.mark_steps(execution["id"], [(1, "StepDone"), (0, "StepDone")])
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.data["operations"][0], {})
+        self.assertIn("step_idx", res.data["operations"][1])
+
+        after = self.client.get(f"/api/executions/{execution['id']}/history/")
+        self.assertEqual(history.data, after.data)
+
+    def test_batch_needs_fewer_queries_than_single_marks(self):
+        process = self.create_process(20)
+        execution = self.start_execution(process["meta"]["id"])
+        operations = [(i, m) for i in range(1, 21) for m in ("StepStarted", "StepDone")]
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.mark_steps(execution["id"], operations)
+        self.assertEqual(res.data["state"], "done")
+        self.assertLess(len(ctx.captured_queries), 3 * len(operations))
+
+
+class ProfilingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.meta_id = self.create_process(2)["meta"]["id"]
+
+    def test_server_timing_header(self):
+        process = self.create_process(2)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(f"/api/processes/{process['meta']['id']}/")
+
+        timings = dict(
+            (t.strip().split(";")[0], t) for t in res["Server-Timing"].split(",")
+        )
+        self.assertEqual(set(timings), {"db", "serialize", "render", "app", "total"})
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timings["db"])
+
+    def test_serialize_time(self):
+        @serializing
+        def nested():
+            time.sleep(0.05)
+
+        @serializing
+        def build():
+            nested()
+            list(User.objects.all())
+
+        def slow_query(execute, *args):
+            time.sleep(0.05)
+            return execute(*args)
+
+        profile = RequestProfile()
+        with profiling(profile), connection.execute_wrapper(slow_query):
+            build()
+        self.assertEqual(profile.queries, 1)
+        self.assertGreaterEqual(profile.db, 0.05)
+        # counted once, without the time of the query
+        self.assertGreaterEqual(profile.serialize, 0.05)
+        self.assertLess(profile.serialize, 0.1)
+
+    async def test_profiles_async_requests(self):
+        await self.async_client.aforce_login(self.user)
+        res = await self.async_client.get(f"/api/processes/{self.meta_id}/")
+        self.assertEqual(res.status_code, 200)
+
+        timings = dict(
+            (t.strip().split(";")[0], t) for t in res["Server-Timing"].split(",")
+        )
+        self.assertNotIn('desc="0 queries"', timings["db"])
+        self.assertNotEqual(timings["serialize"], "serialize;dur=0.00")
+
+    @override_settings(DEBUG=True)
+    def test_middleware_not_adapted_under_asgi(self):
+        # Django logs each middleware it has to run in a thread, or an event loop
+        with self.assertNoLogs("django.request", "DEBUG"):
+            handler = ASGIHandler()
+        for hook in handler._template_response_middleware:
+            self.assertTrue(iscoroutinefunction(hook))
+
+    def test_metrics_endpoint(self):
+        self.create_process(1)
+        self.client.get("/api/processes/")
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        res = self.client.get("/api/metrics/")
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res["Content-Type"].startswith("text/plain"))
+
+        body = res.content.decode()
+        self.assertIn("# TYPE prapp_request_duration_seconds histogram", body)
+        self.assertIn(
+            'prapp_request_db_queries_bucket{view="process-list",method="GET",le="+Inf"}',
+            body,
+        )
+
+
+class PayloadTests(ApiTestCase):
+    """The fast path must render exactly like the serializers"""
+
+    def assertSameJson(self, fast, data):
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(data))
+
+    def setUp(self):
+        super().setUp()
+        process = self.create_process(3)
+        self.meta_id = process["meta"]["id"]
+        for _ in range(2):
+            execution = self.start_execution(self.meta_id)
+        self.mark_step(execution["id"], 2, "StepDone")
+        self.execution = Execution.objects.get(pk=execution["id"])
+
+    def test_process(self):
+        process = Process.objects.select_related("meta").get(current_of=self.meta_id)
+        self.assertSameJson(
+            payloads.process_payloads([process])[0], ProcessSerializer(process).data
+        )
+
+    def test_execution(self):
+        self.assertSameJson(
+            payloads.execution_payload(self.execution),
+            ExecutionSerializer(self.execution).data,
+        )
+
+    def test_execution_state(self):
+        self.assertSameJson(
+            payloads.execution_state_payload(self.execution),
+            ExecutionStateSerializer(self.execution).data,
+        )
+
+    def test_shallow_executions(self):
+        executions = Execution.objects.filter(meta=self.meta_id)
+        self.assertSameJson(
+            payloads.shallow_execution_payloads(
+                executions.values(*payloads.SHALLOW_EXECUTION_FIELDS)
+            ),
+            ExecutionShallowSerializer(executions, many=True).data,
+        )
+
+    def test_benchmark_compares_serializations(self):
+        seeded = benchmark.seed(benchmark.Dataset(templates=1, executions=1))
+        for serialization in benchmark.SERIALIZATIONS:
+            obj = serialization.load(seeded)
+            self.assertSameJson(serialization.fast(obj), serialization.serializer(obj))
+
+
+class CachedAuthenticationTests(APITestCase):
+    def setUp(self):
+        caches["auth"].clear()
+        self.user = User.objects.create_user("bob", password="secret")
+
+    def get_as(self, authorization):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get("/api/processes/", HTTP_AUTHORIZATION=authorization)
+        user_queries = [q for q in ctx.captured_queries if "auth_user" in q["sql"]]
+        return res.status_code, len(user_queries)
+
+    def basic(self, password):
+        return "Basic " + base64.b64encode(f"bob:{password}".encode()).decode()
+
+    def test_basic_credentials_are_verified_once(self):
+        with mock.patch(
+            "django.contrib.auth.base_user.check_password", wraps=check_password
+        ) as check:
+            self.assertEqual(self.get_as(self.basic("secret")), (200, 1))
+            self.assertEqual(self.get_as(self.basic("secret")), (200, 1))
+            self.assertEqual(self.get_as(self.basic("secret")), (200, 0))
+            self.assertEqual(check.call_count, 1)
+
+        self.assertEqual(self.get_as(self.basic("wrong"))[0], 401)
+
+    def test_basic_password_change(self):
+        self.get_as(self.basic("secret"))
+        self.user.set_password("changed")
+        self.user.save()
+        self.assertEqual(self.get_as(self.basic("secret"))[0], 401)
+        self.assertEqual(self.get_as(self.basic("changed"))[0], 200)
+
+    def test_jwt_user_is_cached(self):
+        token = f"Bearer {RefreshToken.for_user(self.user).access_token}"
+        self.assertEqual(self.get_as(token), (200, 1))
+        self.assertEqual(self.get_as(token), (200, 0))
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_as(token)[0], 401)
+
+
+class ArchiveTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        process = self.create_process(2)
+        self.meta_id = process["meta"]["id"]
+        self.done = self.start_execution(self.meta_id)["id"]
+        for idx in (1, 2):
+            self.mark_step(self.done, idx, "StepDone")
+        self.mark_step(self.done, 2, "StepStarted")
+        self.started = self.start_execution(self.meta_id)["id"]
+
+    def snapshot_of(self, execution_id):
+        url = f"/api/executions/{execution_id}/"
+        res = self.client.get(url)
+        return res.data, res["ETag"], self.client.get(url + "history/").data
+
+    def test_archive_keeps_responses(self):
+        before = self.snapshot_of(self.done)
+        call_command("archive_executions", older_than=0, stdout=StringIO())
+
+        execution = Execution.objects.get(pk=self.done)
+        self.assertTrue(execution.archived)
+        self.assertFalse(execution.history.exists())
+        self.assertFalse(execution.step_states.exists())
+        self.assertEqual(execution.archived_history.count(), 4)
+        self.assertEqual(self.snapshot_of(self.done), before)
+        self.assertEqual(
+            execution.step_infos, Execution.objects.get(pk=self.done).step_infos
+        )
+
+        # started executions stay in the working tables
+        self.assertFalse(Execution.objects.get(pk=self.started).archived)
+
+    def test_write_restores_archived_execution(self):
+        Execution.objects.get(pk=self.done).archive()
+        self.assertEqual(self.mark_step(self.done, 1, "StepStarted").status_code, 200)
+
+        execution = Execution.objects.get(pk=self.done)
+        self.assertFalse(execution.archived)
+        self.assertFalse(ArchivedHistoryItem.objects.exists())
+        self.assertEqual(execution.history.count(), 5)
+        self.assertEqual(execution.step_infos, execution.replay_history())
+
+        # the restored items keep their ids, the new one comes after them
+        ids = list(execution.history.order_by("id").values_list("id", flat=True))
+        history = self.client.get(
+            f"/api/executions/{self.done}/history/?since={ids[3]}"
+        )
+        self.assertEqual([i["id"] for i in history.data["items"]], ids[4:])
+
+    def test_rebuild_keeps_execution_archived(self):
+        before = self.snapshot_of(self.done)
+        execution = Execution.objects.get(pk=self.done)
+        execution.archive()
+        snapshot = execution.snapshot
+        Execution.objects.filter(pk=self.done).update(snapshot={"steps": {}})
+
+        call_command("rebuild_execution_state", stdout=StringIO())
+
+        execution = Execution.objects.get(pk=self.done)
+        self.assertTrue(execution.archived)
+        self.assertEqual(execution.snapshot, snapshot)
+        self.assertEqual(execution.archived_history.count(), 4)
+        self.assertFalse(execution.history.exists())
+        self.assertFalse(execution.step_states.exists())
+        self.assertEqual(self.snapshot_of(self.done), before)
+
+    def test_only_done_executions_are_archived(self):
+        with self.assertRaises(ValueError):
+            Execution.objects.get(pk=self.started).archive()
+
+
+class ExportTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        process = self.create_process(2)
+        self.meta_id = process["meta"]["id"]
+        self.executions = [self.start_execution(self.meta_id)["id"] for _ in range(3)]
+        for idx, mark_as in ((1, "StepDone"), (2, "StepStarted"), (2, "StepDone")):
+            self.mark_step(self.executions[0], idx, mark_as)
+        Execution.objects.get(pk=self.executions[0]).archive()
+
+    def export(self, output):
+        res = self.client.get(f"/api/processes/{self.meta_id}/export/?output={output}")
+        self.assertEqual(res.status_code, 200)
+        return streamed(res).decode()
+
+    def test_ndjson_matches_execution_payload(self):
+        lines = self.export("ndjson").splitlines()
+        self.assertEqual(len(lines), 3)
+        for line in lines:
+            exported = json.loads(line)
+            payload = self.client.get(f"/api/executions/{exported['id']}/").json()
+            for idx, step in enumerate(payload["process"]["steps"]):
+                for field in ("title", "startedAt", "startedBy", "doneAt", "doneBy"):
+                    self.assertEqual(exported["steps"][idx][field], step[field])
+        self.assertEqual([json.loads(line)["id"] for line in lines], self.executions)
+
+    def test_csv_has_a_row_per_step(self):
+        rows = list(csv.DictReader(StringIO(self.export("csv"))))
+        self.assertEqual(len(rows), 3 * 3)
+        self.assertEqual(rows[0]["execution_id"], self.executions[0])
+        self.assertEqual(rows[2]["doneBy"], str(self.user.pk))
+
+    def test_query_count_independent_of_executions(self):
+        def count():
+            with CaptureQueriesContext(connection) as ctx:
+                self.export("ndjson")
+            return len(ctx.captured_queries)
+
+        before = count()
+        for _ in range(5):
+            self.start_execution(self.meta_id)
+        self.assertEqual(count(), before)
+
+    async def test_streamed_chunk_by_chunk(self):
+        await self.async_client.aforce_login(self.user)
+        with mock.patch.object(export, "CHUNK_SIZE", 1), mock.patch.object(
+            export, "_payloads", wraps=export._payloads
+        ) as payloads:
+            res = await self.async_client.get(
+                f"/api/processes/{self.meta_id}/export/?output=ndjson"
+            )
+            self.assertTrue(res.is_async)
+
+            # the first line is sent once the first chunk is read
+            stream = aiter(res.streaming_content)
+            self.assertEqual(json.loads(await anext(stream))["id"], self.executions[0])
+            self.assertEqual(payloads.call_count, 1)
+
+            self.assertEqual(len([line async for line in stream]), 2)
+            self.assertEqual(payloads.call_count, 3)
+
+    def test_rejects_unknown_output(self):
+        res = self.client.get(f"/api/processes/{self.meta_id}/export/?output=xml")
+        self.assertEqual(res.status_code, 400)
+
+
+class StepDurationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        process = self.create_process(2)
+        self.meta_id = process["meta"]["id"]
+
+    def durations(self):
+        res = self.client.get(f"/api/processes/{self.meta_id}/step_durations/")
+        self.assertEqual(res.status_code, 200)
+        return res.data
+
+    def test_marking_done_rolls_up_duration(self):
+        execution = self.start_execution(self.meta_id)["id"]
+        self.mark_step(execution, 1, "StepDone")
+        # done again without being restarted, not another duration
+        self.mark_step(execution, 1, "StepDone")
+        # done without being started, no duration
+        self.mark_step(execution, 2, "StepDone")
+
+        first, second = self.durations()
+        self.assertEqual((first["step_idx"], first["count"]), (1, 1))
+        self.assertLess(first["max"], 1)
+        self.assertEqual(first["p50"], first["max"])
+        self.assertEqual(
+            (second["count"], second["p50"], second["p95"], second["max"]),
+            (0, None, None, None),
+        )
+
+    def test_percentiles_across_revisions(self):
+        step = Step.objects.get(process__meta=self.meta_id, position=1)
+        StepDurationBucket.record(
+            [(step.pk, timedelta(seconds=seconds)) for seconds in range(1, 101)]
+        )
+
+        # a new revision with the steps reordered, keeping their titles
+        payload = make_process_payload(2)
+        payload["steps"][1:] = reversed(payload["steps"][1:])
+        self.client.put(f"/api/processes/{self.meta_id}/", payload, format="json")
+        new_step = Step.objects.get(process__current_of=self.meta_id, position=2)
+        StepDurationBucket.record([(new_step.pk, timedelta(seconds=200))])
+
+        stats = {d["title"]: d for d in self.durations()}["Step 0"]
+        self.assertEqual(stats["step_idx"], 2)
+        self.assertEqual(stats["count"], 101)
+        self.assertEqual(stats["max"], 200)
+        # within the precision of the buckets
+        self.assertAlmostEqual(stats["p50"], 51, delta=51 * 0.19)
+        self.assertAlmostEqual(stats["p95"], 96, delta=96 * 0.19)
+
+    def test_steps_sharing_a_title(self):
+        payload = {
+            "title": "Checklist",
+            "steps": [
+                {"title": title, "type": "ST"} for title in ("Check", "Other", "Check")
+            ],
+        }
+        self.client.put(f"/api/processes/{self.meta_id}/", payload, format="json")
+        execution = self.start_execution(self.meta_id)["id"]
+        self.mark_step(execution, 0, "StepStarted")
+        self.mark_step(execution, 0, "StepDone")
+        self.assertEqual([d["count"] for d in self.durations()], [1, 0, 0])
+
+        # matched by their order among the steps with that title
+        payload["steps"].insert(0, {"title": "Check", "type": "ST"})
+        self.client.put(f"/api/processes/{self.meta_id}/", payload, format="json")
+        self.assertEqual([d["count"] for d in self.durations()], [1, 0, 0, 0])
+
+
+class StartExecutionsTests(ApiTestCase):
+    def start_executions(self, meta_id, count):
+        return self.client.post(
+            f"/api/processes/{meta_id}/start_executions/",
+            {"count": count},
+            format="json",
+        )
+
+    @staticmethod
+    def normalize(payload):
+        """The parts of an execution payload that do not differ between executions"""
+        steps = [
+            {**step, "startedAt": step["startedAt"] is not None}
+            for step in payload["process"]["steps"]
+        ]
+        return {
+            "state": payload["state"],
+            "initiatedBy": payload["initiatedBy"],
+            "process": {**payload["process"], "steps": steps},
+        }
+
+    def test_matches_single_start(self):
+        meta_id = self.create_process(2)["meta"]["id"]
+        single = self.start_execution(meta_id)
+
+        res = self.start_executions(meta_id, 3)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [set(e) for e in res.data],
+            [{"id", "initiatedAt", "initiatedBy", "state"}] * 3,
+        )
+        for execution in res.data:
+            full = self.client.get(f"/api/executions/{execution['id']}/").data
+            self.assertEqual(self.normalize(full), self.normalize(single))
+
+        listing = self.client.get(f"/api/processes/{meta_id}/executions/")
+        self.assertEqual(len(listing.data["results"]), 4)
+
+    def test_query_count_independent_of_count(self):
+        meta_id = self.create_process(2)["meta"]["id"]
+
+        def count(n):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.start_executions(meta_id, n).status_code, 200)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count(1), count(50))
+
+    def test_rejects_invalid_count(self):
+        meta_id = self.create_process(1)["meta"]["id"]
+        self.assertEqual(self.start_executions(meta_id, 0).status_code, 400)
+        self.assertEqual(self.start_executions(meta_id, 1000).status_code, 400)
+
+
+class ExecutionFilterTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.meta_id = self.create_process(1)["meta"]["id"]
+        self.executions = [self.start_execution(self.meta_id)["id"] for _ in range(4)]
+        for execution in self.executions[1::2]:
+            self.mark_step(execution, 1, "StepDone")
+
+    def list(self, query=""):
+        res = self.client.get(f"/api/processes/{self.meta_id}/executions/?{query}")
+        self.assertEqual(res.status_code, 200)
+        return [e["id"] for e in res.data["results"]]
+
+    def test_filter_by_state(self):
+        self.assertEqual(
+            set(self.list("state=started")), {self.executions[0], self.executions[2]}
+        )
+        self.assertEqual(
+            set(self.list("state=done")), {self.executions[1], self.executions[3]}
+        )
+        self.assertEqual(len(self.list()), 4)
+
+    def test_oldest_first_across_pages(self):
+        Execution.objects.filter(pk=self.executions[2]).update(
+            initiatedAt=timezone.now() + timedelta(days=1)
+        )
+        res = self.client.get(
+            f"/api/processes/{self.meta_id}/executions/"
+            "?state=started&ordering=initiatedAt&page_size=1"
+        )
+        self.assertEqual([e["id"] for e in res.data["results"]], [self.executions[0]])
+        res = self.client.get(res.data["next"])
+        self.assertEqual([e["id"] for e in res.data["results"]], [self.executions[2]])
+        self.assertIsNone(res.data["next"])
+
+    def test_rejects_unknown_state(self):
+        res = self.client.get(f"/api/processes/{self.meta_id}/executions/?state=x")
+        self.assertEqual(res.status_code, 400)
+
+
+class PatchRevisionTests(ApiTestCase):
+    def patch(self, meta_id, body, **extra):
+        return self.client.patch(
+            f"/api/processes/{meta_id}/", body, format="json", **extra
+        )
+
+    def test_operations_match_full_update(self):
+        process = self.create_process(5)
+        meta_id = process["meta"]["id"]
+        steps = [dict(s) for s in process["steps"]]
+
+        res = self.patch(
+            meta_id,
+            {
+                "title": "Edited",
+                "operations": [
+                    {"op": "delete", "step_idx": 2},
+                    {
+                        "op": "insert",
+                        "step_idx": 0,
+                        "step": {"title": "New", "type": "ST"},
+                    },
+                    {"op": "update", "step_idx": 4, "step": {"description": "Changed"}},
+                    {"op": "move", "step_idx": 1, "to": 5},
+                    {
+                        "op": "insert",
+                        "step_idx": 6,
+                        "step": {"title": "Last", "type": "SE"},
+                    },
+                ],
+            },
+        )
+        self.assertEqual(res.status_code, 200)
+
+        del steps[2]
+        steps.insert(
+            0,
+            {
+                "title": "New",
+                "type": "ST",
+                "description": "",
+                "startWithPrevious": False,
+            },
+        )
+        steps[4]["description"] = "Changed"
+        steps.insert(5, steps.pop(1))
+        steps.insert(
+            6,
+            {
+                "title": "Last",
+                "type": "SE",
+                "description": "",
+                "startWithPrevious": False,
+            },
+        )
+        self.assertEqual(res.data["steps"], steps)
+        self.assertEqual(res["ETag"], f'"{res.data["revision"]}"')
+
+        put = self.client.put(
+            f"/api/processes/{meta_id}/",
+            {"title": "Edited", "steps": steps},
+            format="json",
+        )
+        current = self.client.get(f"/api/processes/{meta_id}/").data
+        self.assertEqual(current["revision"], put.data["revision"])
+        self.assertEqual(res.data["steps"], current["steps"])
+        self.assertEqual(res.data["title"], current["title"])
+
+    def test_query_count_independent_of_steps(self):
+        def count_queries(n_steps):
+            process = self.create_process(n_steps)
+            # new content, which existing contents would save queries for
+            step = {"title": f"Renamed {n_steps}"}
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.patch(
+                    process["meta"]["id"],
+                    {
+                        "operations": [
+                            {"op": "update", "step_idx": 1, "step": step},
+                            {"op": "delete", "step_idx": 2},
+                        ]
+                    },
+                )
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(len(res.data["steps"]), n_steps)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count_queries(3), count_queries(120))
+
+    def test_invalid_index_reported_by_operation(self):
+        process = self.create_process(2)
+        res = self.patch(
+            process["meta"]["id"],
+            {
+                "operations": [
+                    {"op": "delete", "step_idx": 0},
+                    {"op": "move", "step_idx": 0, "to": 2},
+                ]
+            },
+        )
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.data["operations"][0], {})
+        self.assertIn("to", res.data["operations"][1])
+        self.assertEqual(Process.objects.filter(meta=process["meta"]["id"]).count(), 1)
+
+        res = self.patch(
+            process["meta"]["id"],
+            {"operations": [{"op": "insert", "step_idx": 0, "step": {"title": "A"}}]},
+        )
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("type", res.data["operations"][0]["step"])
+
+    def test_stale_if_match_rejected(self):
+        process = self.create_process(2)
+        meta_id = process["meta"]["id"]
+        etag = f'"{process["revision"]}"'
+        body = {"operations": [{"op": "delete", "step_idx": 1}]}
+
+        self.assertEqual(self.patch(meta_id, body, HTTP_IF_MATCH=etag).status_code, 200)
+        res = self.patch(meta_id, body, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, 412)
+        self.assertEqual(
+            len(self.client.get(f"/api/processes/{meta_id}/").data["steps"]), 2
+        )
+
+    def test_nothing_to_apply_keeps_revision(self):
+        process = self.create_process(2)
+        meta_id = process["meta"]["id"]
+
+        for body in ({}, {"operations": []}, {"title": process["title"]}):
+            res = self.patch(meta_id, body)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.data["revision"], process["revision"])
+            self.assertEqual(res["ETag"], f'"{process["revision"]}"')
+        self.assertEqual(Process.objects.filter(meta=meta_id).count(), 1)
+
+        res = self.patch(meta_id, {"title": "Renamed"})
+        self.assertNotEqual(res.data["revision"], process["revision"])
+        self.assertEqual(res.data["title"], "Renamed")
+
+
+class StepContentTests(ApiTestCase):
+    def test_revisions_share_contents(self):
+        process = self.create_process(3)
+        url = f"/api/processes/{process['meta']['id']}/"
+        self.assertEqual(StepContent.objects.count(), 4)
+
+        for title in ("Second", "Third"):
+            self.client.put(url, make_process_payload(3, title=title), format="json")
+        self.client.patch(
+            url,
+            {"operations": [{"op": "update", "step_idx": 0, "step": {"title": "New"}}]},
+            format="json",
+        )
+        self.assertEqual(Step.objects.count(), 16)
+        self.assertEqual(StepContent.objects.count(), 5)
+
+        res = self.client.get(url)
+        self.assertEqual(
+            [s["title"] for s in res.data["steps"]],
+            ["New", "Step 0", "Step 1", "Step 2"],
+        )
+
+    def test_intern_keeps_order_and_defaults(self):
+        steps = [
+            {"title": "A", "type": "ST"},
+            {"title": "B", "type": "SE"},
+            {"title": "A", "type": "ST", "description": "", "startWithPrevious": False},
+        ]
+        ids = StepContent.intern(steps)
+        self.assertEqual(ids[0], ids[2])
+        self.assertNotEqual(ids[0], ids[1])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(StepContent.intern(list(reversed(steps))), ids[::-1])
+
+
+class SparseFieldsetTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        process = self.create_process(2)
+        self.meta_id = process["meta"]["id"]
+        self.revision = process["revision"]
+        self.execution_id = self.start_execution(self.meta_id)["id"]
+
+    def test_process_fields_and_omit(self):
+        url = f"/api/processes/{self.meta_id}/"
+        res = self.client.get(url, {"fields": "title,steps.title"})
+        self.assertEqual(
+            res.data,
+            {
+                "title": "Checklist",
+                "steps": [{"title": t} for t in ("Section", "Step 0", "Step 1")],
+            },
+        )
+        self.assertNotEqual(res["ETag"], f'"{self.revision}"')
+
+        res = self.client.get(url, {"omit": "meta,steps.description"})
+        self.assertNotIn("meta", res.data)
+        self.assertEqual(
+            set(res.data["steps"][0]), {"title", "type", "startWithPrevious"}
+        )
+
+        res = self.client.get("/api/processes/", {"fields": "revision"})
+        self.assertEqual(res.data["results"], [{"revision": self.revision}])
+
+    def test_unknown_fields_rejected(self):
+        res = self.client.get(
+            f"/api/processes/{self.meta_id}/", {"omit": "steps.nope,nope"}
+        )
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("steps.nope, nope", str(res.data["omit"]))
+
+        res = self.client.get(
+            f"/api/executions/{self.execution_id}/",
+            {"view": "state", "fields": "process"},
+        )
+        self.assertEqual(res.status_code, 400)
+
+    def test_execution_state_view(self):
+        url = f"/api/executions/{self.execution_id}/"
+        res = self.client.get(url, {"view": "state"})
+        self.assertEqual(res.data["revision"], self.revision)
+        self.assertNotIn("process", res.data)
+        self.assertEqual([s["step_idx"] for s in res.data["steps"]], [0, 1, 2])
+        self.assertEqual(res.data["steps"][1]["startedBy"], self.user.pk)
+
+        etag = res["ETag"]
+        self.assertNotEqual(etag, self.client.get(url)["ETag"])
+        res = self.client.get(url, {"view": "state"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+
+    def test_mark_step_sparse(self):
+        res = self.client.post(
+            f"/api/executions/{self.execution_id}/mark_step/?view=state"
+            "&fields=state,steps.step_idx,steps.doneAt",
+            {"step_idx": 1, "mark_as": "StepDone"},
+            format="json",
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["state"], "started")
+        self.assertEqual(set(res.data["steps"][1]), {"step_idx", "doneAt"})
+        self.assertIsNotNone(res.data["steps"][1]["doneAt"])
+
+        res = self.client.post(
+            f"/api/executions/{self.execution_id}/mark_step/"
+            "?omit=process.steps.description,process.meta",
+            {"step_idx": 2, "mark_as": "StepStarted"},
+            format="json",
+        )
+        self.assertNotIn("meta", res.data["process"])
+        self.assertNotIn("description", res.data["process"]["steps"][0])
+        self.assertIn("startedAt", res.data["process"]["steps"][0])
+
+
+class AdminTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser("admin", password="secret")
+
+    def admin_queries(self, url):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def grow(self, meta_id, execution_id, size):
+        for _ in range(size):
+            self.client.put(
+                f"/api/processes/{meta_id}/", make_process_payload(2), format="json"
+            )
+        operations = [{"step_idx": 1, "mark_as": "StepStarted"}] * size
+        self.client.post(
+            f"/api/executions/{execution_id}/mark_steps/",
+            {"operations": operations},
+            format="json",
+        )
+
+    def test_change_pages_bounded(self):
+        process = self.create_process(2)
+        meta_id = process["meta"]["id"]
+        execution_id = self.start_execution(meta_id)["id"]
+        urls = [
+            f"/admin/backend/meta/{meta_id}/change/",
+            f"/admin/backend/execution/{execution_id}/change/",
+        ]
+
+        self.grow(meta_id, execution_id, 25)
+        # warm up the content type cache
+        for url in urls:
+            self.admin_queries(url)
+        before = [self.admin_queries(url) for url in urls]
+        self.grow(meta_id, execution_id, 25)
+        self.assertEqual(before, [self.admin_queries(url) for url in urls])
+
+    def test_changelists_count_and_search(self):
+        process = self.create_process(2)
+        execution = self.start_execution(process["meta"]["id"])
+        self.client.force_login(self.admin)
+
+        for model in ("meta", "process", "step", "stepcontent", "execution"):
+            for term in ("", "not-an-id", process["meta"]["id"], "alice"):
+                res = self.client.get(f"/admin/backend/{model}/", {"q": term})
+                self.assertEqual(res.status_code, 200)
+
+        res = self.client.get("/admin/backend/execution/", {"q": execution["id"]})
+        self.assertEqual(res.context["cl"].result_count, 1)
+        res = self.client.get("/admin/backend/execution/", {"q": "alice"})
+        self.assertEqual(res.context["cl"].result_count, 1)
+        res = self.client.get("/admin/backend/execution/", {"q": "not-an-id"})
+        self.assertEqual(res.context["cl"].result_count, 0)
+
+        res = self.client.get(
+            "/admin/backend/historyitem/", {"execution__id__exact": execution["id"]}
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.context["cl"].result_count, 1)
+
+        with mock.patch.object(EstimatedCountPaginator, "COUNT_LIMIT", 3):
+            res = self.client.get("/admin/backend/step/")
+        self.assertEqual(res.context["cl"].result_count, 3)
+
+
+class RendererTests(ApiTestCase):
+    def test_renders_like_drf(self):
+        process = self.create_process(2)
+        execution = self.start_execution(process["meta"]["id"])
+        data = {
+            "process": process,
+            "execution": execution,
+            "at": timezone.now(),
+            "text": "line\u2028separator \u00e9",
+            "nested": [{"empty": None, "number": 1.5}],
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            ORJSONRenderer().render(data, "application/json; indent=2"),
+            JSONRenderer().render(data, "application/json; indent=2"),
+        )
+        self.assertEqual(ORJSONRenderer().render(None), b"")
+
+    def test_renders_non_string_keys(self):
+        field = serializers.ListField(child=serializers.IntegerField())
+        with self.assertRaises(serializers.ValidationError) as ctx:
+            field.run_validation([1, "x"])
+        for data in (ctx.exception.detail, {1: "x", None: 2, 1.5: 3}):
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_benchmark_compares_renderings(self):
+        seeded = benchmark.seed(benchmark.Dataset(templates=1, executions=1))
+        for load in benchmark.RENDERINGS.values():
+            data = load(seeded)
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parses_requests(self):
+        parser = ORJSONParser()
+        self.assertEqual(
+            parser.parse(BytesIO('{"a": [1, "\u00e9"]}'.encode())), {"a": [1, "é"]}
+        )
+
+        res = self.client.post(
+            "/api/processes/",
+            json.dumps(make_process_payload(1)),
+            content_type="application/json",
+        )
+        self.assertEqual(res.status_code, 201)
+        res = self.client.post(
+            "/api/processes/", "{not json", content_type="application/json"
+        )
+        self.assertEqual(res.status_code, 400)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=1024)
+class CompressionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.meta_id = self.create_process(20)["meta"]["id"]
+
+    def test_compresses_large_responses(self):
+        url = f"/api/processes/{self.meta_id}/"
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertGreater(len(plain.content), 1024)
+
+        res = self.client.get(url, HTTP_ACCEPT_ENCODING="br;q=0, gzip, deflate")
+        self.assertEqual(res["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", res["Vary"])
+        self.assertEqual(res["Content-Length"], str(len(res.content)))
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+        self.assertEqual(res["ETag"], plain["ETag"][:-1] + '-gzip"')
+
+        res = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(res["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(res.content), plain.content)
+        self.assertEqual(res["ETag"], plain["ETag"][:-1] + '-br"')
+
+        res = self.client.get(url, HTTP_ACCEPT_ENCODING="identity, gzip;q=0")
+        self.assertFalse(res.has_header("Content-Encoding"))
+
+    def test_coded_etags_in_conditional_requests(self):
+        url = f"/api/processes/{self.meta_id}/"
+        etag = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")["ETag"]
+
+        res = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res["ETag"], etag)
+
+        res = self.client.patch(
+            url,
+            {"operations": [{"op": "delete", "step_idx": 1}]},
+            format="json",
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(res.status_code, 200)
+
+    def test_leaves_small_responses(self):
+        res = self.client.get(
+            f"/api/processes/{self.meta_id}/?fields=title",
+            HTTP_ACCEPT_ENCODING="gzip",
+        )
+        self.assertFalse(res.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", res["Vary"])
+
+    def test_compresses_exports(self):
+        for _ in range(10):
+            self.start_execution(self.meta_id)
+        url = f"/api/processes/{self.meta_id}/export/?output=ndjson"
+        plain = streamed(self.client.get(url))
+
+        res = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(res["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(streamed(res)), plain)
+
+        res = self.client.get(url, HTTP_ACCEPT_ENCODING="br")
+        self.assertEqual(res["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(streamed(res)), plain)
+
+    def test_leaves_other_types(self):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip")
+        for response in (
+            HttpResponse("x" * 2048),
+            StreamingHttpResponse(["x" * 2048], content_type="text/event-stream"),
+        ):
+            response = CompressionMiddleware(lambda r: response)(request)
+            self.assertFalse(response.has_header("Content-Encoding"))
+            self.assertFalse(response.has_header("Vary"))
+
+
+@override_settings(REPLICA_DATABASE="replica", REPLICA_STICKINESS=10)
+class ReplicaRoutingTests(TestCase):
+    """Routing decisions only, the test database has no replica to query"""
+
+    def handle(self, request):
+        def get_response(request):
+            self.read_from = router.db_for_read(Process)
+            instance = Process()
+            instance._state.db = "replica"
+            self.written_to = router.db_for_write(Process, instance=instance)
+            return HttpResponse()
+
+        return ReplicaMiddleware(get_response)(request)
+
+    def test_reads_of_safe_requests_go_to_replica(self):
+        response = self.handle(RequestFactory().get("/api/processes/"))
+        self.assertEqual((self.read_from, self.written_to), ("replica", "default"))
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+        # outside of a request
+        self.assertEqual(router.db_for_read(Process), "default")
+
+    def test_reads_stick_to_primary_after_write(self):
+        response = self.handle(RequestFactory().post("/api/processes/"))
+        self.assertEqual(self.read_from, "default")
+        self.assertEqual(response.cookies[STICKY_COOKIE]["max-age"], 10)
+
+        request = RequestFactory().get("/api/processes/")
+        request.COOKIES[STICKY_COOKIE] = response.cookies[STICKY_COOKIE].value
+        self.handle(request)
+        self.assertEqual(self.read_from, "default")
+
+    @override_settings(REPLICA_DATABASE=None)
+    def test_without_replica(self):
+        response = self.handle(RequestFactory().get("/api/processes/"))
+        self.assertEqual(self.read_from, "default")
+        response = self.handle(RequestFactory().post("/api/processes/"))
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+
+@override_settings(REPLICA_DATABASE="replica")
+class ReplicaReadTests(APITransactionTestCase):
+    """
+    Reads through the API, from a replica mirroring the test database. The
+    replica is another connection, which only sees committed writes.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # for this class only, and named in databases once it exists, as the
+        # test runner sets up the databases named before running any class
+        connections.settings["replica"] = {
+            **connections["default"].settings_dict,
+            "TEST": {"MIRROR": "default"},
+        }
+        cls.addClassCleanup(cls.remove_replica)
+        cls.databases = {"default", "replica"}
+        super().setUpClass()
+
+    @staticmethod
+    def remove_replica():
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", password="secret")
+        self.client.force_authenticate(self.user)
+
+    def test_reads_through_api(self):
+        res = self.client.post(
+            "/api/processes/", make_process_payload(3), format="json"
+        )
+        url = f"/api/processes/{res.data['meta']['id']}/"
+        self.client.cookies.clear()
+
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.data["steps"]), 4)
+        self.assertIn('"backend_process"', replica.captured_queries[0]["sql"])
+
+        self.client.put(url, make_process_payload(2), format="json")
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            res = self.client.get(url)
+        self.assertEqual(len(res.data["steps"]), 3)
+        self.assertEqual(replica.captured_queries, [])
+
+    def test_writers_without_cookies_read_primary(self):
+        self.client.force_authenticate(None)
+        credentials = base64.b64encode(b"alice:secret").decode()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Basic {credentials}")
+
+        res = self.client.post(
+            "/api/processes/", make_process_payload(3), format="json"
+        )
+        self.assertEqual(res.status_code, 201)
+        url = f"/api/processes/{res.data['meta']['id']}/"
+        self.client.cookies.clear()
+
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            res = self.client.get(url)
+        self.assertEqual(len(res.data["steps"]), 4)
+        # authenticating may still read the user from it, but nothing after
+        self.assertNotIn(
+            '"backend_process"', " ".join(q["sql"] for q in replica.captured_queries)
+        )
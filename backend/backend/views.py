@@ -1,29 +1,131 @@
-from rest_framework import viewsets, permissions, status, serializers
+from rest_framework import viewsets, permissions, renderers, status, serializers
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.decorators import action
+from django.db import transaction
+from django.db.models import F, prefetch_related_objects
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from .serializers import (
     EmptySerializer,
+    ExecutionDeltaSerializer,
     ExecutionMarkStepSerializer,
+    ExecutionMarkStepsSerializer,
+    ExecutionHistoryQuerySerializer,
+    ExecutionHistorySerializer,
+    ExecutionListQuerySerializer,
+    ExecutionQuerySerializer,
     ExecutionSerializer,
     ExecutionShallowSerializer,
+    ExecutionStateSerializer,
+    ProcessExportQuerySerializer,
+    ProcessPatchSerializer,
+    ProcessQuerySerializer,
     ProcessSerializer,
+    ProcessStartExecutionsSerializer,
+    StepDurationSerializer,
+)
+from . import analytics, export, fieldsets
+from .caching import combined_etag, not_modified, revision_cache, with_etag
+from .metrics import registry
+from .models import Execution, Meta, Process, last_history_id
+from .payloads import (
+    SHALLOW_EXECUTION_FIELDS,
+    execution_payload,
+    execution_state_payload,
+    process_payloads,
+    shallow_execution_payloads,
+)
+from .revisions import InvalidOperation, derive_revision
+from .pagination import ExecutionCursorPagination, ProcessCursorPagination
+from drf_spectacular.utils import (
+    extend_schema,
+    OpenApiParameter,
+    PolymorphicProxySerializer,
 )
-from .models import Execution, Meta, Process
-from drf_spectacular.utils import extend_schema, OpenApiParameter, inline_serializer
 from drf_spectacular.types import OpenApiTypes
 
 
+# the representations of an execution, see ExecutionQuerySerializer
+EXECUTION_VIEWS = PolymorphicProxySerializer(
+    component_name="ExecutionView",
+    serializers=[ExecutionSerializer, ExecutionStateSerializer],
+    resource_type_field_name=None,
+)
+
+
+def prune(payload, query: dict):
+    """Apply the sparse fieldset of a validated SparseFieldsetQuerySerializer"""
+    return fieldsets.prune(payload, query.get("fields"), query.get("omit"))
+
+
+def render_execution(execution: Execution, query: dict) -> dict:
+    """The representation of an execution selected by an ExecutionQuerySerializer"""
+    if query["view"] == "state":
+        return prune(execution_state_payload(execution), query)
+    return prune(execution_payload(execution), query)
+
+
+def representation_etag(request, etag: str) -> str:
+    """
+    ETag of the representation selected by the query string,
+    such as a sparse fieldset, of a resource with the given ETag
+    """
+    if not request.query_params:
+        return etag
+    return combined_etag([etag, request.query_params.urlencode()])
+
+
 class ProcessViewSet(viewsets.GenericViewSet):
     serializer_class = ProcessSerializer
-    queryset = Process.objects.all()
+    queryset = Process.objects.select_related("meta")
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ProcessCursorPagination
+
+    def get_current_revision(self, pk) -> Process:
+        """Latest revision of the process with the given meta.id"""
+        return get_object_or_404(self.get_queryset(), current_of=pk)
+
+    def serialize_revisions(self, processes: list[Process]) -> list[dict]:
+        """
+        Serialize the given revisions, using the revision cache where possible.
+        Steps are only loaded for revisions missing from the cache.
+        """
+        cache = revision_cache()
+        payloads = cache.get_many([str(p.revision) for p in processes])
 
+        missing = [p for p in processes if str(p.revision) not in payloads]
+        if missing:
+            fresh = {
+                str(p.revision): d for p, d in zip(missing, process_payloads(missing))
+            }
+            cache.set_many(fresh)
+            payloads.update(fresh)
+
+        return [payloads[str(p.revision)] for p in processes]
+
+    @extend_schema(parameters=[ProcessQuerySerializer])
     def list(self, request):
-        queryset = Meta.objects.all()
-        processes = map(lambda x: x.latest_revision, queryset)
-        serializer = ProcessSerializer(processes, many=True)
-        return Response(serializer.data)
+        query = ProcessQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        processes = self.get_queryset().filter(current_of__isnull=False)
+        # through the meta joined for the filter, whose index serves the order
+        processes = processes.annotate(
+            metaCreatedAt=F("current_of__createdAt"), metaId=F("current_of__id")
+        )
+        page = self.paginate_queryset(processes)
+
+        # the links change when processes are added before or after the page
+        links = [self.paginator.get_next_link(), self.paginator.get_previous_link()]
+        etag = combined_etag(
+            [request.get_full_path(), *links] + [p.revision for p in page]
+        )
+        if (response := not_modified(request, etag)) is not None:
+            return response
+
+        payloads = prune(self.serialize_revisions(page), query.validated_data)
+        return with_etag(self.get_paginated_response(payloads), etag)
 
     @extend_schema(
         parameters=[
@@ -33,12 +135,21 @@ class ProcessViewSet(viewsets.GenericViewSet):
                 OpenApiParameter.PATH,
                 description="Process ID found in meta.id",
             ),
+            ProcessQuerySerializer,
         ]
     )
     def retrieve(self, request, pk=None):
-        meta = get_object_or_404(Meta.objects.all(), pk=pk)
-        serializer = ProcessSerializer(meta.latest_revision)
-        return Response(serializer.data)
+        query = ProcessQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        process = self.get_current_revision(pk)
+
+        # a revision never changes, so its id is a strong validator
+        etag = representation_etag(request, str(process.revision))
+        if (response := not_modified(request, etag)) is not None:
+            return response
+
+        payload = prune(self.serialize_revisions([process])[0], query.validated_data)
+        return with_etag(Response(payload), etag)
 
     def create(self, request):
         serializer = ProcessSerializer(data=request.data, context={"request": request})
@@ -69,81 +180,325 @@ class ProcessViewSet(viewsets.GenericViewSet):
         return Response(serializer.data)
 
     @extend_schema(
-        operation_id="processes_start_execution", responses={200: ExecutionSerializer}
+        parameters=[
+            OpenApiParameter(
+                "revision",
+                OpenApiTypes.UUID,
+                OpenApiParameter.PATH,
+                description="Process ID found in meta.id",
+            )
+        ],
+        request=ProcessPatchSerializer,
+        responses={200: ProcessSerializer},
+    )
+    def partial_update(self, request, pk=None):
+        """
+        Create a new revision by applying step operations to the current one,
+        in order. Steps that are not touched are copied within the database.
+        Send the ETag of the current revision as If-Match to detect
+        concurrent edits, which are answered with 412. Without operations
+        nor a new title, the current revision is returned unchanged.
+        """
+        req = ProcessPatchSerializer(data=request.data)
+        req.is_valid(raise_exception=True)
+        operations = req.validated_data.get("operations", [])
+        title = req.validated_data.get("title")
+
+        with transaction.atomic():
+            # serializes edits of the same process
+            get_object_or_404(Meta.objects.select_for_update(), pk=pk)
+            current = self.get_current_revision(pk)
+            if (response := not_modified(request, str(current.revision))) is not None:
+                return response
+            if not operations and title in (None, current.title):
+                return with_etag(
+                    Response(self.serialize_revisions([current])[0]),
+                    str(current.revision),
+                )
+
+            try:
+                process = derive_revision(current, operations, title)
+            except InvalidOperation as e:
+                errors = [{} for _ in operations]
+                errors[e.operation] = {e.field: "Must be a valid index of a step"}
+                raise serializers.ValidationError({"operations": errors})
+
+        etag = str(process.revision)
+        return with_etag(Response(self.serialize_revisions([process])[0]), etag)
+
+    @extend_schema(
+        operation_id="processes_start_execution",
+        parameters=[ExecutionQuerySerializer],
+        responses={200: EXECUTION_VIEWS},
     )
     @action(detail=True, methods=["POST"], serializer_class=EmptySerializer)
     def start_execution(self, request, pk=None):
-        process = get_object_or_404(Meta.objects.all(), pk=pk).latest_revision
+        query = ExecutionQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        process = self.get_current_revision(pk)
 
-        exec = process.executions.create(initiatedBy=request.user)
+        with transaction.atomic():
+            exec = process.executions.create(initiatedBy=request.user)
+            prefetch_related_objects([process], "steps")
 
-        steps = exec.process.steps.all()
-        first_step = next((s for s in steps if s.type == "ST"), None)
-        if (first_step is not None) and (first_step.startWithPrevious):
-            exec.history.create(type="StepStarted", step=first_step, by=request.user)
+            steps = exec.process.steps.all()
+            first_step = next((s for s in steps if s.type == "ST"), None)
+            if (first_step is not None) and (first_step.startWithPrevious):
+                exec.record("StepStarted", first_step, request.user)
+            else:
+                exec.update_state()
 
-        serializer = ExecutionSerializer(exec)
-        return Response(serializer.data)
+        return Response(render_execution(exec, query.validated_data))
 
-    @extend_schema(responses={200: ExecutionShallowSerializer(many=True)})
-    @action(detail=True, methods=["GET"], serializer_class=EmptySerializer)
+    @extend_schema(
+        operation_id="processes_start_executions",
+        responses={200: ExecutionShallowSerializer(many=True)},
+    )
+    @action(
+        detail=True,
+        methods=["POST"],
+        serializer_class=ProcessStartExecutionsSerializer,
+    )
+    def start_executions(self, request, pk=None):
+        """
+        Start several executions of the current revision at once.
+        Returns them shallow, retrieve an execution for the state of its steps.
+        """
+        req = ProcessStartExecutionsSerializer(data=request.data)
+        req.is_valid(raise_exception=True)
+
+        process = self.get_current_revision(pk)
+        executions = Execution.start_many(
+            process, request.user, req.validated_data["count"]
+        )
+
+        rows = [
+            {
+                "id": e.id,
+                "initiatedAt": e.initiatedAt,
+                "initiatedBy": e.initiatedBy_id,
+                "state": e.state,
+            }
+            for e in executions
+        ]
+        return Response(shallow_execution_payloads(rows))
+
+    @extend_schema(
+        parameters=[ExecutionListQuerySerializer],
+        responses={200: ExecutionShallowSerializer(many=True)},
+    )
+    @action(
+        detail=True,
+        methods=["GET"],
+        serializer_class=EmptySerializer,
+        pagination_class=ExecutionCursorPagination,
+    )
     def executions(self, request, pk=None):
+        """Executions of the process, optionally only those in the given state"""
+        query = ExecutionListQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
         meta = get_object_or_404(Meta.objects.all(), pk=pk)
-        execs = Execution.objects.filter(process__meta=meta.id).order_by("-initiatedAt")
+        execs = Execution.objects.filter(meta=meta.id)
+        if "state" in query.validated_data:
+            execs = execs.filter(state=query.validated_data["state"])
+
+        page = self.paginate_queryset(execs.values(*SHALLOW_EXECUTION_FIELDS))
+        return self.get_paginated_response(shallow_execution_payloads(page))
+
+    @extend_schema(
+        operation_id="processes_export",
+        parameters=[ProcessExportQuerySerializer],
+        responses={
+            (200, "application/x-ndjson"): OpenApiTypes.STR,
+            (200, "text/csv"): OpenApiTypes.STR,
+        },
+    )
+    @action(detail=True, methods=["GET"], serializer_class=EmptySerializer)
+    def export(self, request, pk=None):
+        """
+        All executions of the process with the timings of their steps, oldest first.
+        NDJSON has a document per execution, CSV a row per step of each execution.
+        The response is streamed while the executions are read, when served
+        through the ASGI application in prapp/asgi.py.
+        """
+        query = ProcessExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        output = query.validated_data["output"]
 
-        serializer = ExecutionShallowSerializer(execs, many=True)
+        meta = get_object_or_404(Meta.objects.all(), pk=pk)
+        if output == "csv":
+            lines, content_type = export.csv_lines(meta.pk), "text/csv"
+        else:
+            lines, content_type = export.ndjson_lines(meta.pk), "application/x-ndjson"
+
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response[
+            "Content-Disposition"
+        ] = f'attachment; filename="executions-{meta.pk}.{output}"'
+        return response
+
+    @extend_schema(
+        operation_id="processes_step_durations",
+        responses={200: StepDurationSerializer(many=True)},
+    )
+    @action(detail=True, methods=["GET"], serializer_class=EmptySerializer)
+    def step_durations(self, request, pk=None):
+        """
+        Time from a step being started to it being done, for each step of the
+        process, across all its revisions and executions. Percentiles are
+        accurate to about 19%, the maximum is exact.
+        """
+        meta = get_object_or_404(Meta.objects.all(), pk=pk)
+        serializer = StepDurationSerializer(analytics.step_durations(meta), many=True)
         return Response(serializer.data)
 
 
 class ExecutionViewSet(viewsets.GenericViewSet):
     serializer_class = ExecutionSerializer
-    queryset = Execution.objects.all()
+    queryset = Execution.objects.select_related("process__meta").prefetch_related(
+        "process__steps"
+    )
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_etag(self, pk) -> str:
+        """
+        ETag of an execution, derived from its latest history item.
+        Every change to an execution appends to its history,
+        and archiving it keeps the ids of its items.
+        """
+        execution = get_object_or_404(
+            Execution.objects.annotate(last_history=last_history_id()).values(
+                "id", "last_history"
+            ),
+            pk=pk,
+        )
+        return f"{execution['id']}:{execution['last_history'] or 0}"
+
+    @extend_schema(
+        parameters=[ExecutionQuerySerializer], responses={200: EXECUTION_VIEWS}
+    )
     def retrieve(self, request, pk=None):
+        query = ExecutionQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        etag = representation_etag(request, self.get_etag(pk))
+        if (response := not_modified(request, etag)) is not None:
+            return response
+
+        # the payload loads the steps itself
+        execution = get_object_or_404(
+            Execution.objects.select_related("process__meta"), pk=pk
+        )
+        return with_etag(
+            Response(render_execution(execution, query.validated_data)), etag
+        )
+
+    @extend_schema(
+        parameters=[ExecutionHistoryQuerySerializer],
+        responses={200: ExecutionHistorySerializer},
+    )
+    @action(detail=True, methods=["GET"], serializer_class=EmptySerializer)
+    def history(self, request, pk=None):
+        """
+        History items created after the given cursor, oldest first.
+        Writes to an execution are serialized (see Execution.record),
+        so its items become visible in cursor order.
+        """
+        query = ExecutionHistoryQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        since = query.validated_data["since"]
+
         execution = get_object_or_404(Execution.objects.all(), pk=pk)
-        serializer = ExecutionSerializer(execution)
+        items = list(
+            execution.history_items()
+            .filter(id__gt=since)
+            .select_related("step")
+            .order_by("id")
+        )
+
+        serializer = ExecutionHistorySerializer(
+            {"items": items, "cursor": items[-1].id if items else since}
+        )
         return Response(serializer.data)
 
     @extend_schema(
-        operation_id="executions_mark_step", responses={200: ExecutionSerializer}
+        operation_id="executions_mark_step",
+        parameters=[ExecutionQuerySerializer],
+        responses={200: EXECUTION_VIEWS},
     )
     @action(detail=True, methods=["post"], serializer_class=ExecutionMarkStepSerializer)
     def mark_step(self, request, pk=None):
         req = ExecutionMarkStepSerializer(data=request.data)
         req.is_valid(raise_exception=True)
+        query = ExecutionQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
 
         step_idx, mark_as = req.data["step_idx"], req.data["mark_as"]
-        execution = get_object_or_404(Execution.objects.all(), pk=pk)
-        steps = execution.process.steps.all()
+        execution = get_object_or_404(self.get_queryset(), pk=pk)
 
         try:
-            step = steps[step_idx]
-            if step.type != "ST":
-                raise Exception()
-        except:
+            execution.mark_steps([(step_idx, mark_as)], request.user)
+        except Execution.InvalidStep:
             raise serializers.ValidationError(
                 {"step_idx": "Must be a valid index of a step with type ST"}
             )
 
-        # create the history item where the step gets marked as "started" or "done"
-        execution.history.create(type=mark_as, step=step, by=request.user)
-
-        # get the following step
-        following_steps = steps[(step_idx + 1) :]
-        next_step = next((s for s in following_steps if s.type == "ST"), None)
-
-        # the next step might have "startWithPrevious" set
-        # if that's the case and the current step is marked as done
-        # we shall mark the following step as started
-        if (
-            (mark_as == "StepDone")
-            and (next_step is not None)
-            and (next_step.startWithPrevious)
-        ):
-            execution.history.create(
-                type="StepStarted", step=next_step, by=request.user
-            )
+        return Response(render_execution(execution, query.validated_data))
+
+    @extend_schema(
+        operation_id="executions_mark_steps", responses={200: ExecutionDeltaSerializer}
+    )
+    @action(
+        detail=True, methods=["post"], serializer_class=ExecutionMarkStepsSerializer
+    )
+    def mark_steps(self, request, pk=None):
+        """
+        Apply several mark_step operations in order, within a single transaction.
+        Returns the state of the execution and of the steps that changed.
+        """
+        req = ExecutionMarkStepsSerializer(data=request.data)
+        req.is_valid(raise_exception=True)
 
-        serializer = ExecutionSerializer(execution)
+        operations = [(op["step_idx"], op["mark_as"]) for op in req.data["operations"]]
+        execution = get_object_or_404(self.get_queryset(), pk=pk)
+
+        try:
+            changed = execution.mark_steps(operations, request.user)
+        except Execution.InvalidStep as e:
+            # errors by operation, like the validation errors of a list
+            errors = [{} for _ in operations]
+            errors[e.operation] = {
+                "step_idx": "Must be a valid index of a step with type ST"
+            }
+            raise serializers.ValidationError({"operations": errors})
+
+        serializer = ExecutionDeltaSerializer(
+            {"state": execution.state, "steps": changed},
+            context={"execution": execution},
+        )
         return Response(serializer.data)
+
+
+class PlainTextRenderer(renderers.BaseRenderer):
+    media_type = "text/plain"
+    format = "txt"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, str):
+            # error responses
+            data = str(data.get("detail", data))
+        return data.encode()
+
+
+@extend_schema(exclude=True)
+class MetricsView(APIView):
+    """Request metrics of this server process, in the Prometheus text format"""
+
+    permission_classes = [permissions.IsAdminUser]
+    renderer_classes = [PlainTextRenderer]
+
+    def get(self, request):
+        return Response(
+            registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
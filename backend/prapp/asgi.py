@@ -2,6 +2,8 @@
 ASGI config for prapp project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The live execution event streams (api/executions/<id>/events/) are held open
+and therefore require serving the project through this entry point.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -29,16 +29,73 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework.authentication.BasicAuthentication",
+        "backend.authentication.CachedBasicAuthentication",
         "rest_framework.authentication.SessionAuthentication",
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "backend.authentication.CachedJWTAuthentication",
+    ),
+    # the defaults of DRF, with JSON encoded and decoded by orjson
+    "DEFAULT_RENDERER_CLASSES": (
+        "backend.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "backend.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
     ),
 }
 
 SPECTACULAR_SETTINGS = {"COMPONENT_SPLIT_REQUEST": True}
 
+# Process revisions are immutable, so their serialized payload is cached without
+# a timeout. The local memory cache evicts the least recently used entries
+# once MAX_ENTRIES is reached.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "revisions": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "revisions",
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("REVISION_CACHE_SIZE", 1000))},
+    },
+    # Users and verified Basic credentials, see backend.authentication.
+    # Entries are invalidated when a user is saved, but only within the same
+    # process, other processes pick up the change once the TIMEOUT expires.
+    # Point this to a shared cache to invalidate them everywhere at once.
+    "auth": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "auth",
+        "TIMEOUT": int(os.environ.get("AUTH_CACHE_TIMEOUT", 60)),
+    },
+}
+
+# Alias of a read replica in DATABASES, e.g. "replica". If set, requests without
+# side effects read from it, see backend.routers. Clients that wrote something
+# read from the default database for the next REPLICA_STICKINESS seconds. They
+# are recognized by a cookie, and authenticated users by their id, remembered in
+# the default cache: point it to a shared cache when running several processes.
+# Locally, a second SQLite database with {"TEST": {"MIRROR": "default"}} works.
+REPLICA_DATABASE = os.environ.get("REPLICA_DATABASE")
+REPLICA_STICKINESS = int(os.environ.get("REPLICA_STICKINESS", 10))
+DATABASE_ROUTERS = ["backend.routers.ReplicaRouter"]
+
+# Responses smaller than this many bytes are not compressed,
+# see backend.middleware.CompressionMiddleware
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+
+# Fan-out of execution history items to the live event streams.
+# The default only reaches subscribers within the same server process, so the
+# Dockerfile runs a single worker.
+EXECUTION_BROADCASTER = "backend.broadcast.InProcessBroadcaster"
+
 
 MIDDLEWARE = [
+    # first, so its timings cover all other middleware
+    "backend.middleware.ProfilingMiddleware",
+    "backend.routers.ReplicaMiddleware",
+    "backend.middleware.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
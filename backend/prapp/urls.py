@@ -18,7 +18,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
-from backend import views
+from backend import events, views
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularRedocView,
@@ -36,7 +36,13 @@ apirouter.register(r"executions", views.ExecutionViewSet, basename="execution")
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path(
+        "api/executions/<uuid:pk>/events/",
+        events.execution_events,
+        name="execution-events",
+    ),
     path("api/", include(apirouter.urls)),
+    path("api/metrics/", views.MetricsView.as_view(), name="metrics"),
     path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
     path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
@@ -31,11 +31,13 @@ import {
   EditTemplateButton,
   StartExecutionButton,
 } from "./components/Process/ActionButtons";
+import { nextCursor } from "./util";
 
 export const ProcessExecutions = ({ id }: { id: string }) => {
   const api = useApi();
   const [, setLocation] = useLocation();
   const [executions, setExecutions] = useState<ExecutionShallow[]>();
+  const [cursor, setCursor] = useState<string>();
 
   useEffect(() => {
     let active = true;
@@ -45,7 +47,8 @@ export const ProcessExecutions = ({ id }: { id: string }) => {
         revision: id,
       });
       if (!active) return;
-      setExecutions(res);
+      setExecutions(res.results);
+      setCursor(nextCursor(res.next));
     };
     do_work();
 
@@ -54,6 +57,15 @@ export const ProcessExecutions = ({ id }: { id: string }) => {
     };
   }, [id, api.processes]);
 
+  const loadMore = useCallback(async () => {
+    const res = await api.processes.processesExecutionsList({
+      revision: id,
+      cursor,
+    });
+    setExecutions((old) => [...(old ?? []), ...res.results]);
+    setCursor(nextCursor(res.next));
+  }, [id, cursor, api.processes]);
+
   return (
     <Card withBorder shadow="none">
       <LoadingOverlay visible={!executions} />
@@ -103,6 +115,13 @@ export const ProcessExecutions = ({ id }: { id: string }) => {
             </Card.Section>
           ))
         : undefined}
+      {cursor && (
+        <Card.Section inheritPadding py="sm">
+          <Button variant="subtle" fullWidth onClick={loadMore}>
+            Load more
+          </Button>
+        </Card.Section>
+      )}
     </Card>
   );
 };
@@ -180,13 +199,15 @@ export const TemplateList = () => {
   const api = useApi();
   const [, setLocation] = useLocation();
   const [processes, setProcesses] = useImmer<Process[]>([]);
+  const [cursor, setCursor] = useState<string>();
 
   useEffect(() => {
     let active = true;
     const do_work = async () => {
-      const res = await api.processes.processesList();
+      const res = await api.processes.processesList({});
       if (!active) return;
-      setProcesses(res);
+      setProcesses(res.results);
+      setCursor(nextCursor(res.next));
     };
     do_work();
 
@@ -195,6 +216,14 @@ export const TemplateList = () => {
     };
   }, [setProcesses, api.processes]);
 
+  const loadMore = useCallback(async () => {
+    const res = await api.processes.processesList({ cursor });
+    setProcesses((draft) => {
+      draft.push(...res.results);
+    });
+    setCursor(nextCursor(res.next));
+  }, [cursor, setProcesses, api.processes]);
+
   return (
     <Stack>
       <Group justify="flex-end">
@@ -208,6 +237,11 @@ export const TemplateList = () => {
       {processes.map((process) => (
         <TemplateProcessCard key={process.meta.id} process={process} />
       ))}
+      {cursor && (
+        <Button variant="subtle" fullWidth onClick={loadMore}>
+          Load more
+        </Button>
+      )}
     </Stack>
   );
 };
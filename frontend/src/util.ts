@@ -13,3 +13,9 @@ export const replaceColorStrings = (
   original.replace(/rgba\(0, 0, 0, ([\d]\.[\d]+)\)/g, (_, transparency) =>
     alpha(new_color, transparency)
   );
+
+/**
+ * Extracts the cursor from the "next" link of a paginated API response
+ */
+export const nextCursor = (next?: string | null) =>
+  next ? new URL(next).searchParams.get("cursor") ?? undefined : undefined;